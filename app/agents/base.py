@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple, Type
 import logging
+from pydantic import BaseModel, ValidationError
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +17,27 @@ class BaseAgent(ABC):
         """Process input data and return structured output"""
         pass
     
-    def log_info(self, message: str):
-        self.logger.info(f"[{self.name}] {message}")
+    def log_info(self, message: str, *args: Any):
+        """Log at INFO; `args` are %-formatted into `message` only if the record is emitted"""
+        self.logger.info("[%s] " + message, self.name, *args)
     
-    def log_error(self, message: str):
-        self.logger.error(f"[{self.name}] {message}")
\ No newline at end of file
+    def log_error(self, message: str, *args: Any):
+        """Log at ERROR; `args` are %-formatted into `message` only if the record is emitted"""
+        self.logger.error("[%s] " + message, self.name, *args)
+    
+    def validate_schema(self, model: Type[BaseModel], data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """Validate extracted data against a document schema
+        
+        Returns the normalized data and an empty error list on success, or the
+        original data and one message per schema error on failure.
+        """
+        try:
+            document = model.parse_obj(data)
+        except ValidationError as e:
+            errors = []
+            for error in e.errors():
+                field = ".".join(str(loc) for loc in error['loc'] if loc != '__root__')
+                errors.append(f"{field}: {error['msg']}" if field else error['msg'])
+            return data, errors
+        
+        return document.dict(exclude={'type'}), []
\ No newline at end of file
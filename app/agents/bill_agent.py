@@ -1,20 +1,26 @@
 from typing import Dict, Any
 from app.agents.base import BaseAgent
-from app.services.llm_service import LLMService
+from app.services.llm_service import LLMService, EXTRACT_HEAD_TOKENS, EXTRACT_TAIL_TOKENS
+from app.models.schemas import DocumentCtx, BillDocument
 
 class BillAgent(BaseAgent):
     """Agent specialized in processing medical bills"""
     
+    # Token budget for the document text sent to the LLM
+    head_tokens = EXTRACT_HEAD_TOKENS
+    tail_tokens = EXTRACT_TAIL_TOKENS
+    focus = None
+    
     def __init__(self, llm_service: LLMService):
         super().__init__("BillAgent")
         self.llm_service = llm_service
     
-    async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, data: DocumentCtx) -> Dict[str, Any]:
         """
         Process medical bill document
         
         Args:
-            data: Dict containing document text and metadata
+            data: Document context with text and metadata
             
         Returns:
             Dict with extracted bill information
@@ -22,27 +28,19 @@ class BillAgent(BaseAgent):
         try:
             self.log_info("Processing medical bill document")
             
-            text = data['text']
+            text = self.llm_service.truncate(data.text, self.head_tokens, self.tail_tokens, self.focus)
             
             # Extract structured data from bill
             extracted_data = await self.llm_service.extract_bill_data(text)
             
-            # Validate extracted data
-            validation_errors = self._validate_bill_data(extracted_data)
-            
-            result = {
-                'type': 'bill',
-                'extracted_data': extracted_data,
-                'validation_errors': validation_errors,
-                'processing_status': 'completed' if not validation_errors else 'completed_with_warnings'
-            }
+            result = self.build_result(extracted_data)
             
-            self.log_info(f"Bill processing completed. Found {len(validation_errors)} validation issues")
+            self.log_info("Bill processing completed. Found %d validation issues", len(result['validation_errors']))
             
             return result
             
         except Exception as e:
-            self.log_error(f"Bill processing failed: {str(e)}")
+            self.log_error("Bill processing failed: %s", e)
             return {
                 'type': 'bill',
                 'extracted_data': {},
@@ -50,22 +48,15 @@ class BillAgent(BaseAgent):
                 'processing_status': 'failed'
             }
     
-    def _validate_bill_data(self, data: Dict[str, Any]) -> list:
-        """Validate extracted bill data"""
-        errors = []
-        
-        # Check for critical fields
-        if not data.get('hospital_name'):
-            errors.append("Hospital name not found")
-        
-        if not data.get('total_amount'):
-            errors.append("Total amount not found")
-        
-        if not data.get('date_of_service'):
-            errors.append("Date of service not found")
-        
-        # Validate amount format
-        if data.get('total_amount') and not isinstance(data['total_amount'], (int, float)):
-            errors.append("Invalid total amount format")
+    def build_result(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate extracted data and wrap it in the agent result format"""
+        cache_hit = extracted_data.pop('cache_hit', False)
+        extracted_data, validation_errors = self.validate_schema(BillDocument, extracted_data)
         
-        return errors
\ No newline at end of file
+        return {
+            'type': 'bill',
+            'extracted_data': extracted_data,
+            'validation_errors': validation_errors,
+            'processing_status': 'completed' if not validation_errors else 'completed_with_warnings',
+            'cache_hit': cache_hit
+        }
\ No newline at end of file
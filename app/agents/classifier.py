@@ -1,6 +1,20 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import re
 from app.agents.base import BaseAgent
+from app.agents import keywords
 from app.services.llm_service import LLMService
+from app.models.schemas import DocumentCtx
+
+# Filename signals used to classify obvious documents without an LLM call;
+# text anchors live in app.agents.keywords
+FILENAME_PATTERNS = {
+    'bill': re.compile(r"(?i)bill|invoice|receipt"),
+    'discharge_summary': re.compile(r"(?i)discharge|summary"),
+    'id_card': re.compile(r"(?i)id[_-]?card|insurance[_-]?card|policy"),
+}
+
+HEURISTIC_SCAN_CHARS = 2048
+HEURISTIC_CONFIDENCE = 0.9
 
 class ClassifierAgent(BaseAgent):
     """Agent responsible for classifying document types"""
@@ -9,39 +23,127 @@ class ClassifierAgent(BaseAgent):
         super().__init__("ClassifierAgent")
         self.llm_service = llm_service
     
-    async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, data: DocumentCtx) -> Dict[str, Any]:
         """
         Classify document type based on content and filename
         
         Args:
-            data: Dict containing 'text' and 'filename'
+            data: Document context with text and filename
             
         Returns:
-            Dict with classification results
+            Dict with classification results; 'extracted_data' holds the fields
+            extracted alongside an LLM classification, or None
         """
         try:
-            self.log_info(f"Classifying document: {data['filename']}")
+            self.log_info("Classifying document: %s", data.filename)
+            
+            text = data.text
+            filename = data.filename
             
-            text = data['text']
-            filename = data['filename']
+            # Skip the LLM when filename/keyword signals are unambiguous. Otherwise
+            # classify and extract in one call so the agent does not call the LLM again
+            heuristic = self.classify_heuristic(data)
+            if heuristic is not None:
+                return heuristic
             
-            # Use LLM to classify document
-            result = await self.llm_service.classify_document(text, filename)
+            result = await self.llm_service.classify_and_extract(text, filename)
+            extracted = result.get('extracted')
+            extracted_data = extracted if isinstance(extracted, dict) else None
             
-            self.log_info(f"Classification result: {result['type']} (confidence: {result['confidence']})")
+            self.log_info("Classification result: %s (confidence: %s)", result['type'], result['confidence'])
             
             return {
                 'type': result['type'],
                 'confidence': result['confidence'],
                 'reasoning': result.get('reasoning', ''),
-                'filename': filename
+                'filename': filename,
+                'extracted_data': extracted_data,
+                'cache_hit': result.get('cache_hit', False)
             }
             
         except Exception as e:
-            self.log_error(f"Classification failed: {str(e)}")
+            self.log_error("Classification failed: %s", e)
             return {
                 'type': 'unknown',
                 'confidence': 0.0,
                 'reasoning': f"Classification error: {str(e)}",
-                'filename': data.get('filename', 'unknown')
-            }
\ No newline at end of file
+                'filename': data.filename
+            }
+    
+    def classify_heuristic(self, data: DocumentCtx) -> Optional[Dict[str, Any]]:
+        """Return a classification result without calling the LLM, or None when ambiguous"""
+        result = self._heuristic_classify(data.text, data.filename)
+        if result is None:
+            return None
+        
+        self.log_info("Classification result: %s (confidence: %s)", result['type'], result['confidence'])
+        return {
+            'type': result['type'],
+            'confidence': result['confidence'],
+            'reasoning': result.get('reasoning', ''),
+            'filename': data.filename,
+            'extracted_data': None,
+            'cache_hit': False
+        }
+    
+    def _heuristic_classify(self, text: str, filename: str) -> Optional[Dict[str, Any]]:
+        """Classify from filename and text anchors, returning None when ambiguous"""
+        anchor_counts = keywords.scan(text[:HEURISTIC_SCAN_CHARS])
+        
+        scores = {}
+        for doc_type, pattern in FILENAME_PATTERNS.items():
+            scores[doc_type] = anchor_counts.get(doc_type, 0) + (1 if pattern.search(filename or '') else 0)
+        
+        matches = [doc_type for doc_type, score in scores.items() if score >= 2]
+        if len(matches) != 1:
+            return None
+        
+        return {
+            'type': matches[0],
+            'confidence': HEURISTIC_CONFIDENCE,
+            'reasoning': f"Matched {scores[matches[0]]} filename/keyword signals for {matches[0]}"
+        }
+    
+    async def process_batch(self, documents: List[DocumentCtx]) -> List[Dict[str, Any]]:
+        """
+        Classify and extract several documents with a single LLM request
+        
+        Args:
+            documents: List of document contexts with text and filename
+            
+        Returns:
+            List of classification results in input order, with 'extracted_data'
+        """
+        try:
+            self.log_info("Classifying %d documents in one batch", len(documents))
+            
+            results = await self.llm_service.classify_and_extract_batch(
+                [(doc.text, doc.filename) for doc in documents]
+            )
+            
+            classifications = []
+            for doc, result in zip(documents, results):
+                extracted = result.get('extracted')
+                classifications.append({
+                    'type': result.get('type', 'unknown'),
+                    'confidence': result.get('confidence', 0.0),
+                    'reasoning': result.get('reasoning', ''),
+                    'filename': doc.filename,
+                    'extracted_data': extracted if isinstance(extracted, dict) else None,
+                    'cache_hit': result.get('cache_hit', False)
+                })
+                self.log_info("Classification result for %s: %s (confidence: %s)", doc.filename, classifications[-1]['type'], classifications[-1]['confidence'])
+            
+            return classifications
+            
+        except Exception as e:
+            self.log_error("Batch classification failed: %s", e)
+            return [
+                {
+                    'type': 'unknown',
+                    'confidence': 0.0,
+                    'reasoning': f"Classification error: {str(e)}",
+                    'filename': doc.filename
+                }
+                for doc in documents
+            ]
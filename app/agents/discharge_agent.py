@@ -1,20 +1,27 @@
 from typing import Dict, Any
 from app.agents.base import BaseAgent
-from app.services.llm_service import LLMService
+from app.services.llm_service import LLMService, EXTRACT_HEAD_TOKENS, EXTRACT_TAIL_TOKENS, DISCHARGE_FOCUS
+from app.models.schemas import DocumentCtx, DischargeSummaryDocument
 
 class DischargeAgent(BaseAgent):
     """Agent specialized in processing discharge summaries"""
     
+    # Token budget for the document text sent to the LLM
+    head_tokens = EXTRACT_HEAD_TOKENS
+    tail_tokens = EXTRACT_TAIL_TOKENS
+    # Keep the part of long summaries that covers diagnosis, admission and discharge
+    focus = DISCHARGE_FOCUS
+    
     def __init__(self, llm_service: LLMService):
         super().__init__("DischargeAgent")
         self.llm_service = llm_service
     
-    async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, data: DocumentCtx) -> Dict[str, Any]:
         """
         Process discharge summary document
         
         Args:
-            data: Dict containing document text and metadata
+            data: Document context with text and metadata
             
         Returns:
             Dict with extracted discharge summary information
@@ -22,27 +29,19 @@ class DischargeAgent(BaseAgent):
         try:
             self.log_info("Processing discharge summary document")
             
-            text = data['text']
+            text = self.llm_service.truncate(data.text, self.head_tokens, self.tail_tokens, self.focus)
             
             # Extract structured data from discharge summary
             extracted_data = await self.llm_service.extract_discharge_data(text)
             
-            # Validate extracted data
-            validation_errors = self._validate_discharge_data(extracted_data)
+            result = self.build_result(extracted_data)
             
-            result = {
-                'type': 'discharge_summary',
-                'extracted_data': extracted_data,
-                'validation_errors': validation_errors,
-                'processing_status': 'completed' if not validation_errors else 'completed_with_warnings'
-            }
-            
-            self.log_info(f"Discharge summary processing completed. Found {len(validation_errors)} validation issues")
+            self.log_info("Discharge summary processing completed. Found %d validation issues", len(result['validation_errors']))
             
             return result
             
         except Exception as e:
-            self.log_error(f"Discharge summary processing failed: {str(e)}")
+            self.log_error("Discharge summary processing failed: %s", e)
             return {
                 'type': 'discharge_summary',
                 'extracted_data': {},
@@ -50,27 +49,15 @@ class DischargeAgent(BaseAgent):
                 'processing_status': 'failed'
             }
     
-    def _validate_discharge_data(self, data: Dict[str, Any]) -> list:
-        """Validate extracted discharge summary data"""
-        errors = []
-        
-        # Check for critical fields
-        if not data.get('patient_name'):
-            errors.append("Patient name not found")
-        
-        if not data.get('diagnosis'):
-            errors.append("Diagnosis not found")
-        
-        if not data.get('admission_date'):
-            errors.append("Admission date not found")
-        
-        if not data.get('discharge_date'):
-            errors.append("Discharge date not found")
-        
-        # Validate date consistency
-        if data.get('admission_date') and data.get('discharge_date'):
-            # Basic date validation (could be enhanced)
-            if data['admission_date'] > data['discharge_date']:
-                errors.append("Admission date is after discharge date")
+    def build_result(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate extracted data and wrap it in the agent result format"""
+        cache_hit = extracted_data.pop('cache_hit', False)
+        extracted_data, validation_errors = self.validate_schema(DischargeSummaryDocument, extracted_data)
         
-        return errors
\ No newline at end of file
+        return {
+            'type': 'discharge_summary',
+            'extracted_data': extracted_data,
+            'validation_errors': validation_errors,
+            'processing_status': 'completed' if not validation_errors else 'completed_with_warnings',
+            'cache_hit': cache_hit
+        }
\ No newline at end of file
@@ -1,20 +1,26 @@
 from typing import Dict, Any
 from app.agents.base import BaseAgent
-from app.services.llm_service import LLMService
+from app.services.llm_service import LLMService, EXTRACT_HEAD_TOKENS, EXTRACT_TAIL_TOKENS
+from app.models.schemas import DocumentCtx, IDCardDocument
 
 class IDCardAgent(BaseAgent):
     """Agent specialized in processing insurance ID cards"""
     
+    # Token budget for the document text sent to the LLM
+    head_tokens = EXTRACT_HEAD_TOKENS
+    tail_tokens = EXTRACT_TAIL_TOKENS
+    focus = None
+    
     def __init__(self, llm_service: LLMService):
         super().__init__("IDCardAgent")
         self.llm_service = llm_service
     
-    async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, data: DocumentCtx) -> Dict[str, Any]:
         """
         Process insurance ID card document
         
         Args:
-            data: Dict containing document text and metadata
+            data: Document context with text and metadata
             
         Returns:
             Dict with extracted ID card information
@@ -22,27 +28,19 @@ class IDCardAgent(BaseAgent):
         try:
             self.log_info("Processing insurance ID card document")
             
-            text = data['text']
+            text = self.llm_service.truncate(data.text, self.head_tokens, self.tail_tokens, self.focus)
             
             # Extract structured data from ID card
             extracted_data = await self.llm_service.extract_id_card_data(text)
             
-            # Validate extracted data
-            validation_errors = self._validate_id_card_data(extracted_data)
-            
-            result = {
-                'type': 'id_card',
-                'extracted_data': extracted_data,
-                'validation_errors': validation_errors,
-                'processing_status': 'completed' if not validation_errors else 'completed_with_warnings'
-            }
+            result = self.build_result(extracted_data)
             
-            self.log_info(f"ID card processing completed. Found {len(validation_errors)} validation issues")
+            self.log_info("ID card processing completed. Found %d validation issues", len(result['validation_errors']))
             
             return result
             
         except Exception as e:
-            self.log_error(f"ID card processing failed: {str(e)}")
+            self.log_error("ID card processing failed: %s", e)
             return {
                 'type': 'id_card',
                 'extracted_data': {},
@@ -50,18 +48,15 @@ class IDCardAgent(BaseAgent):
                 'processing_status': 'failed'
             }
     
-    def _validate_id_card_data(self, data: Dict[str, Any]) -> list:
-        """Validate extracted ID card data"""
-        errors = []
-        
-        # Check for critical fields
-        if not data.get('patient_name'):
-            errors.append("Patient name not found")
-        
-        if not data.get('insurance_id'):
-            errors.append("Insurance ID not found")
-        
-        if not data.get('policy_number'):
-            errors.append("Policy number not found")
+    def build_result(self, extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate extracted data and wrap it in the agent result format"""
+        cache_hit = extracted_data.pop('cache_hit', False)
+        extracted_data, validation_errors = self.validate_schema(IDCardDocument, extracted_data)
         
-        return errors
\ No newline at end of file
+        return {
+            'type': 'id_card',
+            'extracted_data': extracted_data,
+            'validation_errors': validation_errors,
+            'processing_status': 'completed' if not validation_errors else 'completed_with_warnings',
+            'cache_hit': cache_hit
+        }
\ No newline at end of file
@@ -0,0 +1,44 @@
+from typing import Dict
+
+import ahocorasick
+
+# Anchor phrases that identify each document type, matched case-insensitively
+KEYWORDS = {
+    'total due': 'bill',
+    'amount due': 'bill',
+    'total amount': 'bill',
+    'invoice no': 'bill',
+    'invoice number': 'bill',
+    'bill no': 'bill',
+    'bill number': 'bill',
+    'date of discharge': 'discharge_summary',
+    'discharge date': 'discharge_summary',
+    'discharge summary': 'discharge_summary',
+    'date of admission': 'discharge_summary',
+    'admission date': 'discharge_summary',
+    'member id': 'id_card',
+    'policy number': 'id_card',
+    'group number': 'id_card',
+    'subscriber': 'id_card',
+}
+
+def _build_automaton():
+    automaton = ahocorasick.Automaton()
+    for keyword, tag in KEYWORDS.items():
+        automaton.add_word(keyword, (keyword, tag))
+    automaton.make_automaton()
+    return automaton
+
+# One automaton scans the text once for every keyword, including overlapping
+# ones, instead of one search per pattern
+_AUTOMATON = _build_automaton()
+
+def scan(text: str) -> Dict[str, int]:
+    """Return the number of distinct keywords found in `text` for each tag"""
+    found = {keyword for _, (keyword, _) in _AUTOMATON.iter(text.lower())}
+
+    counts: Dict[str, int] = {}
+    for keyword in found:
+        tag = KEYWORDS[keyword]
+        counts[tag] = counts.get(tag, 0) + 1
+    return counts
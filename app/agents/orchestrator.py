@@ -1,6 +1,9 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from fastapi import UploadFile
 import asyncio
+import hashlib
+import os
+import tempfile
 import time
 import logging
 
@@ -11,10 +14,20 @@ from app.agents.discharge_agent import DischargeAgent
 from app.agents.id_card_agent import IDCardAgent
 from app.services.llm_service import LLMService
 from app.services.pdf_service import PDFService
-from app.models.schemas import ClaimProcessingResponse, ProcessedDocument, ValidationResult, ClaimDecision
+from app.services.validation_service import rule_based_validate
+from app.models.schemas import (
+    ClaimProcessingResponse, ProcessedDocument, ValidationResult, ClaimDecision, ClaimStatus, DocumentType, DocumentCtx,
+    DOCUMENT_TYPE_BY_VALUE, CLAIM_STATUS_BY_VALUE
+)
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Uploads larger than this are spooled to disk while being read
+UPLOAD_SPOOL_MAX_SIZE = 8 << 20
+# Maximum number of ambiguous documents classified in a single LLM request
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "6"))
+
 class ClaimOrchestrator:
     """Main orchestrator for claim processing pipeline"""
     
@@ -34,6 +47,10 @@ class ClaimOrchestrator:
             'discharge_summary': self.discharge_agent,
             'id_card': self.id_card_agent
         }
+        
+        # Track how often the rule-based decision has to defer to the LLM
+        self.decisions_total = 0
+        self.decisions_escalated = 0
     
     async def process_claim(self, files: List[UploadFile]) -> ClaimProcessingResponse:
         """
@@ -48,22 +65,16 @@ class ClaimOrchestrator:
         start_time = time.time()
         
         try:
-            logger.info(f"Starting claim processing for {len(files)} files")
+            logger.info("Starting claim processing for %d files", len(files))
             
             # Step 1: Extract text from PDFs
             extracted_texts = await self._extract_texts_from_files(files)
             
-            # Step 2: Classify documents
-            classifications = await self._classify_documents(extracted_texts)
-            
-            # Step 3: Process documents with specialized agents
-            processed_documents = await self._process_documents(classifications)
-            
-            # Step 4: Validate claim data
-            validation_result = await self._validate_claim(processed_documents)
+            # Steps 2-3: Classify and process each document with its specialized agent
+            processed_documents = await self._process_documents(extracted_texts)
             
-            # Step 5: Make claim decision
-            claim_decision = await self._make_claim_decision(processed_documents, validation_result)
+            # Steps 4-5: Validate claim data and make claim decision
+            validation_result, claim_decision = await self._decide_claim(processed_documents)
             
             # Step 6: Structure response
             response = self._structure_response(
@@ -73,11 +84,11 @@ class ClaimOrchestrator:
                 time.time() - start_time
             )
             
-            logger.info(f"Claim processing completed in {response.processing_time:.2f} seconds")
+            logger.info("Claim processing completed in %.2f seconds", response.processing_time)
             return response
             
         except Exception as e:
-            logger.error(f"Claim processing failed: {str(e)}")
+            logger.error("Claim processing failed: %s", e)
             # Return error response
             return ClaimProcessingResponse(
                 documents=[],
@@ -93,129 +104,254 @@ class ClaimOrchestrator:
                 processing_time=time.time() - start_time
             )
     
-    async def _extract_texts_from_files(self, files: List[UploadFile]) -> List[Dict[str, Any]]:
+    async def process_claim_stream(self, files: List[UploadFile]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process claim documents, yielding each result as soon as it is ready
+        
+        Args:
+            files: List of uploaded PDF files
+            
+        Yields:
+            Dicts with an 'event' name ('document', 'validation', 'claim_decision',
+            'complete' or 'error') and its 'data'
+        """
+        start_time = time.time()
+        tasks: List[asyncio.Task] = []
+        
+        try:
+            logger.info("Starting streamed claim processing for %d files", len(files))
+            
+            extracted_texts = await self._extract_texts_from_files(files)
+            
+            # Emit each document as soon as its own pipeline finishes
+            tasks = [asyncio.create_task(self._process_one(doc)) for doc in extracted_texts]
+            processed_documents = []
+            for next_done in asyncio.as_completed(tasks):
+                doc = await next_done
+                processed_documents.append(doc)
+                yield {'event': 'document', 'data': self._to_processed_document(doc).dict()}
+            
+            validation_result, claim_decision = await self._decide_claim(processed_documents)
+            yield {'event': 'validation', 'data': validation_result.dict()}
+            yield {'event': 'claim_decision', 'data': claim_decision.dict()}
+            
+            processing_time = time.time() - start_time
+            logger.info("Streamed claim processing completed in %.2f seconds", processing_time)
+            yield {'event': 'complete', 'data': {'processing_time': processing_time}}
+            
+        except Exception as e:
+            logger.error("Streamed claim processing failed: %s", e)
+            yield {'event': 'error', 'data': {'detail': f"Processing error: {str(e)}"}}
+        finally:
+            # Stop remaining pipelines if the client disconnected early
+            for task in tasks:
+                task.cancel()
+    
+    async def _extract_texts_from_files(self, files: List[UploadFile]) -> List[DocumentCtx]:
         """Extract text from uploaded PDF files"""
         logger.info("Extracting text from PDF files")
         
+        # Parse tasks keyed by content hash, so duplicate uploads in the same
+        # claim share a single parse even when they are read concurrently
+        parse_tasks: Dict[str, asyncio.Task] = {}
+        
         async def extract_single_file(file: UploadFile):
-            content = await file.read()
-            text = await self.pdf_service.extract_text_from_pdf(content)
-            return {
-                'filename': file.filename,
-                'text': text or "",
-                'size': len(content)
-            }
+            hasher = hashlib.sha256()
+            size = 0
+            
+            with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE) as spool:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    spool.write(chunk)
+                    size += len(chunk)
+                
+                content_hash = hasher.hexdigest()
+                parse_task = parse_tasks.get(content_hash)
+                if parse_task is None:
+                    spool.seek(0)
+                    parse_task = asyncio.create_task(
+                        self.pdf_service.extract_text_from_pdf(spool.read(), content_hash=content_hash)
+                    )
+                    parse_tasks[content_hash] = parse_task
+                else:
+                    logger.info("Reusing parse of duplicate upload: %s", file.filename)
+                
+                text = await parse_task
+            
+            return DocumentCtx(filename=file.filename, text=text or "", size=size)
         
         # Process files concurrently
         tasks = [extract_single_file(file) for file in files]
         results = await asyncio.gather(*tasks)
         
-        logger.info(f"Extracted text from {len(results)} files")
+        logger.info("Extracted text from %d files", len(results))
         return results
     
-    async def _classify_documents(self, extracted_texts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Classify document types using ClassifierAgent"""
-        logger.info("Classifying document types")
+    async def _process_documents(self, extracted_texts: List[DocumentCtx]) -> List[DocumentCtx]:
+        """Run the classify -> extract pipeline for every document concurrently"""
+        logger.info("Classifying and processing documents with specialized agents")
+        
+        # Documents the heuristic can classify go straight to their agent; the
+        # ambiguous ones share one classify + extract LLM request per batch
+        ambiguous = []
+        async with asyncio.TaskGroup() as task_group:
+            for doc in extracted_texts:
+                classification = self.classifier_agent.classify_heuristic(doc)
+                if classification is None:
+                    ambiguous.append(doc)
+                else:
+                    task_group.create_task(self._process_one(doc, classification))
+            
+            for start in range(0, len(ambiguous), LLM_BATCH_SIZE):
+                task_group.create_task(self._process_batch(ambiguous[start:start + LLM_BATCH_SIZE]))
+        
+        # Documents are updated in place, so the input order is preserved
+        processed_docs = extracted_texts
+        
+        cache_hits = sum(1 for doc in processed_docs if doc.cache_hit)
+        logger.info("Processed %d documents (%d extractions from cache)", len(processed_docs), cache_hits)
+        return processed_docs
+    
+    async def _process_batch(self, documents: List[DocumentCtx]) -> List[DocumentCtx]:
+        """Classify several documents with one LLM request, then process each one"""
+        if len(documents) == 1:
+            return [await self._process_one(documents[0])]
         
-        async def classify_single_document(doc_data):
-            return await self.classifier_agent.process(doc_data)
+        classifications = await self.classifier_agent.process_batch(documents)
+        return await asyncio.gather(*[
+            self._process_one(doc, classification)
+            for doc, classification in zip(documents, classifications)
+        ])
+    
+    async def _process_one(self, doc: DocumentCtx, classification: Optional[Dict[str, Any]] = None) -> DocumentCtx:
+        """Classify a single document (unless already classified) and process it with the matching agent"""
+        if classification is None:
+            classification = await self.classifier_agent.process(doc)
+        doc.type = classification['type']
+        doc.confidence = classification['confidence']
+        
+        if doc.type not in self.agent_mapping:
+            # Handle unknown document types
+            doc.type = 'unknown'
+            doc.validation_errors = ['Unknown document type']
+            doc.processing_status = 'skipped'
+            return doc
         
-        # Classify documents concurrently
-        tasks = [classify_single_document(doc) for doc in extracted_texts]
-        classifications = await asyncio.gather(*tasks)
+        agent = self.agent_mapping[doc.type]
+        if classification.get('extracted_data') is not None:
+            # The fused classify + extract call already returned the fields
+            result = agent.build_result(classification['extracted_data'])
+            result['cache_hit'] = classification.get('cache_hit', False)
+        else:
+            result = await agent.process(doc)
+        doc.extracted_data = result['extracted_data']
+        doc.validation_errors = result['validation_errors']
+        doc.processing_status = result['processing_status']
+        doc.cache_hit = result.get('cache_hit', False)
+        return doc
+    
+    async def _decide_claim(self, processed_docs: List[DocumentCtx]) -> Tuple[ValidationResult, ClaimDecision]:
+        """Validate the claim and decide it, using the LLM only when the deterministic rules cannot"""
+        validation = self._rule_based_validate(processed_docs)
+        decision = self._rule_based_decide(processed_docs, validation) if validation is not None else None
         
-        # Merge classification results with original data
-        for i, classification in enumerate(classifications):
-            extracted_texts[i].update(classification)
+        self.decisions_total += 1
+        if decision is None:
+            self.decisions_escalated += 1
+            validation, decision = await self._validate_and_decide(processed_docs)
+        logger.info("LLM decision escalation rate: %d/%d", self.decisions_escalated, self.decisions_total)
         
-        logger.info(f"Classified {len(classifications)} documents")
-        return extracted_texts
+        return validation, decision
     
-    async def _process_documents(self, classified_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Process documents with specialized agents"""
-        logger.info("Processing documents with specialized agents")
-        
-        processed_docs = []
-        
-        for doc in classified_docs:
-            doc_type = doc.get('type', 'unknown')
-            
-            if doc_type in self.agent_mapping:
-                agent = self.agent_mapping[doc_type]
-                result = await agent.process(doc)
-                result['filename'] = doc['filename']
-                result['classification_confidence'] = doc.get('confidence', 0.0)
-                processed_docs.append(result)
-            else:
-                # Handle unknown document types
-                processed_docs.append({
-                    'type': 'unknown',
-                    'filename': doc['filename'],
-                    'extracted_data': {},
-                    'validation_errors': ['Unknown document type'],
-                    'processing_status': 'skipped',
-                    'classification_confidence': doc.get('confidence', 0.0)
-                })
-        
-        logger.info(f"Processed {len(processed_docs)} documents")
-        return processed_docs
+    def _rule_based_validate(self, processed_docs: List[DocumentCtx]) -> Optional[ValidationResult]:
+        """Validate the claim without the LLM, returning None when a date cannot be parsed"""
+        result = rule_based_validate(self._decision_data(processed_docs))
+        return ValidationResult(**result) if result is not None else None
     
-    async def _validate_claim(self, processed_docs: List[Dict[str, Any]]) -> ValidationResult:
-        """Validate claim data using LLM"""
-        logger.info("Validating claim data")
+    def _rule_based_decide(self, processed_docs: List[DocumentCtx], validation: ValidationResult) -> Optional[ClaimDecision]:
+        """Decide clear-cut claims without the LLM, returning None when the claim is ambiguous"""
+        failed = [doc.filename for doc in processed_docs if doc.processing_status == 'failed']
+        if failed:
+            return ClaimDecision(
+                status="requires_review",
+                reason=f"Processing failed for: {', '.join(failed)}",
+                confidence=0.95,
+                recommended_actions=["Re-upload or manually review the failed documents"]
+            )
         
-        # Prepare data for validation
-        validation_data = []
-        for doc in processed_docs:
-            validation_data.append({
-                'type': doc['type'],
-                'filename': doc['filename'],
-                'data': doc['extracted_data'],
-                'errors': doc.get('validation_errors', [])
-            })
+        if validation.validation_passed:
+            return ClaimDecision(
+                status="approved",
+                reason="All required documents present with consistent data and no processing errors",
+                confidence=0.95
+            )
+        
+        return None
+    
+    async def _validate_and_decide(self, processed_docs: List[DocumentCtx]) -> Tuple[ValidationResult, ClaimDecision]:
+        """Validate claim data and make the final claim decision using LLM"""
+        logger.info("Validating claim data and making claim decision")
+        
+        decision_data = self._decision_data(processed_docs)
         
-        # Use LLM for validation
-        validation_result = await self.llm_service.validate_claim_data(validation_data)
+        # Use a single LLM call for both stages
+        result = await self.llm_service.validate_and_decide(decision_data)
+        cache_hit = result.pop('cache_hit', False)
+        logger.info("Claim validation and decision cache hit: %s", cache_hit)
         
-        return ValidationResult(
+        # Fall back to the single-stage calls for any part the fused response lacks
+        validation_result = result.get('validation')
+        if not isinstance(validation_result, dict):
+            logger.warning("Fused response had no validation, validating separately")
+            validation_result = await self.llm_service.validate_claim_data(decision_data)
+            validation_result.pop('cache_hit', None)
+        
+        decision_result = result.get('decision')
+        if not isinstance(decision_result, dict):
+            logger.warning("Fused response had no decision, deciding separately")
+            decision_result = await self.llm_service.make_claim_decision(decision_data, validation_result)
+            decision_result.pop('cache_hit', None)
+        
+        validation = ValidationResult(
             missing_documents=validation_result.get('missing_documents', []),
             discrepancies=validation_result.get('discrepancies', []),
             data_quality_issues=validation_result.get('data_quality_issues', []),
             validation_passed=validation_result.get('validation_passed', False)
         )
-    
-    async def _make_claim_decision(self, processed_docs: List[Dict[str, Any]], validation: ValidationResult) -> ClaimDecision:
-        """Make final claim decision using LLM"""
-        logger.info("Making claim decision")
-        
-        # Prepare data for decision making
-        decision_data = []
-        for doc in processed_docs:
-            decision_data.append({
-                'type': doc['type'],
-                'filename': doc['filename'],
-                'data': doc['extracted_data'],
-                'status': doc.get('processing_status', 'unknown')
-            })
-        
-        validation_data = {
-            'missing_documents': validation.missing_documents,
-            'discrepancies': validation.discrepancies,
-            'data_quality_issues': validation.data_quality_issues,
-            'validation_passed': validation.validation_passed
-        }
-        
-        # Use LLM for decision making
-        decision_result = await self.llm_service.make_claim_decision(decision_data, validation_data)
         
-        return ClaimDecision(
-            status=decision_result.get('status', 'requires_review'),
+        decision = ClaimDecision(
+            status=CLAIM_STATUS_BY_VALUE.get(decision_result.get('status'), ClaimStatus.REQUIRES_REVIEW),
             reason=decision_result.get('reason', 'Decision could not be determined'),
             confidence=decision_result.get('confidence', 0.0),
             recommended_actions=decision_result.get('recommended_actions', [])
         )
+        
+        return validation, decision
+    
+    def _decision_data(self, processed_docs: List[DocumentCtx]) -> List[Dict[str, Any]]:
+        """Prepare processed documents for validation and decision making"""
+        return [
+            {
+                'type': doc.type,
+                'filename': doc.filename,
+                'data': doc.extracted_data,
+                'errors': doc.validation_errors,
+                'status': doc.processing_status or 'unknown'
+            }
+            for doc in processed_docs
+        ]
     
-    def _structure_response(self, processed_docs: List[Dict[str, Any]], validation: ValidationResult, 
+    def _to_processed_document(self, doc: DocumentCtx) -> ProcessedDocument:
+        """Convert a pipeline document to its response model"""
+        return ProcessedDocument(
+            type=DOCUMENT_TYPE_BY_VALUE.get(doc.type, DocumentType.UNKNOWN),
+            filename=doc.filename,
+            confidence=doc.confidence,
+            extracted_data=doc.extracted_data,
+            processing_errors=doc.validation_errors
+        )
+    
+    def _structure_response(self, processed_docs: List[DocumentCtx], validation: ValidationResult, 
                           decision: ClaimDecision, processing_time: float) -> ClaimProcessingResponse:
         """Structure the final response"""
         
@@ -224,18 +360,12 @@ class ClaimOrchestrator:
         structured_data = {}
         
         for doc in processed_docs:
-            processed_doc = ProcessedDocument(
-                type=doc['type'],
-                filename=doc['filename'],
-                confidence=doc.get('classification_confidence', 0.0),
-                extracted_data=doc.get('extracted_data', {}),
-                processing_errors=doc.get('validation_errors', [])
-            )
+            processed_doc = self._to_processed_document(doc)
             documents.append(processed_doc)
             
             # Add to structured data
-            if doc['type'] != 'unknown':
-                structured_data[doc['type']] = doc.get('extracted_data', {})
+            if doc.type != 'unknown':
+                structured_data[doc.type] = doc.extracted_data
         
         return ClaimProcessingResponse(
             documents=documents,
@@ -1,15 +1,28 @@
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import List, Optional
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
 import os
+import orjson
 from dotenv import load_dotenv
 
 from app.agents.orchestrator import ClaimOrchestrator
 from app.models.schemas import ClaimProcessingResponse
 from app.services.llm_service import LLMService
 
+# Use libuv's event loop where available (uvloop does not support Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+else:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 # Load environment variables
 load_dotenv()
 
@@ -20,7 +33,9 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="HealthPay Claim Processor",
     description="AI-driven agentic backend for processing medical insurance claims",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson encodes the claim response several times faster than the stdlib encoder
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -33,11 +48,33 @@ app.add_middleware(
 )
 
 # Initialize services
+# One LLMService per process, so the Gemini client connection, worker threads
+# and concurrency limits are shared by every request
+@lru_cache(maxsize=1)
 def get_llm_service():
     return LLMService()
 
-def get_orchestrator(llm_service: LLMService = Depends(get_llm_service)):
-    return ClaimOrchestrator(llm_service)
+# The orchestrator (PDF service, agents, agent mapping) is built once at startup
+_ORCH: Optional[ClaimOrchestrator] = None
+
+@app.on_event("startup")
+async def startup_services():
+    global _ORCH
+    # One shared thread pool serves every asyncio.to_thread call (Gemini requests,
+    # LLM cache I/O). Gemini calls block a thread for their whole network round
+    # trip, so the pool is sized for I/O concurrency per process, not CPU count
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(
+        max_workers=int(os.getenv("LLM_MAX_PARALLEL", "32")),
+        thread_name_prefix="svc"
+    ))
+    _ORCH = ClaimOrchestrator(get_llm_service())
+
+def get_orchestrator() -> ClaimOrchestrator:
+    global _ORCH
+    if _ORCH is None:
+        # Startup handlers do not run when the app is driven without a lifespan
+        _ORCH = ClaimOrchestrator(get_llm_service())
+    return _ORCH
 
 @app.get("/")
 async def root():
@@ -78,6 +115,40 @@ async def process_claim(
         logger.error(f"Error processing claim: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/process-claim/stream")
+async def process_claim_stream(
+    files: List[UploadFile] = File(...),
+    orchestrator: ClaimOrchestrator = Depends(get_orchestrator)
+):
+    """
+    Process medical insurance claim documents, streaming results as Server-Sent Events.
+    
+    Emits a 'document' event per processed file as soon as it is ready, followed by
+    'validation', 'claim_decision' and 'complete' events.
+    """
+    logger.info(f"Streaming processing of {len(files)} files for claim")
+    
+    # Validate file types before the stream starts
+    for file in files:
+        if not file.filename.lower().endswith('.pdf'):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid file type: {file.filename}. Only PDF files are supported."
+            )
+    
+    async def event_stream():
+        async for event in orchestrator.process_claim_stream(files):
+            yield f"event: {event['event']}\ndata: {orjson.dumps(event['data']).decode()}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if uvloop else "asyncio",
+        http="httptools",
+        workers=max(1, (os.cpu_count() or 1) // 2)
+    )
\ No newline at end of file
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator, validator
+from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -14,6 +15,10 @@ class ClaimStatus(str, Enum):
     REJECTED = "rejected"
     REQUIRES_REVIEW = "requires_review"
 
+# Value -> member lookups, avoiding Enum construction in per-document loops
+DOCUMENT_TYPE_BY_VALUE = {m.value: m for m in DocumentType}
+CLAIM_STATUS_BY_VALUE = {m.value: m for m in ClaimStatus}
+
 class ProcessedDocument(BaseModel):
     type: DocumentType
     filename: str
@@ -21,30 +26,48 @@ class ProcessedDocument(BaseModel):
     extracted_data: Dict[str, Any] = Field(default_factory=dict)
     processing_errors: List[str] = Field(default_factory=list)
 
+# Extraction schemas: fields the agents require are non-nullable, so a failed
+# parse reports exactly what the LLM could not find
 class BillDocument(BaseModel):
     type: DocumentType = DocumentType.BILL
-    hospital_name: Optional[str] = None
-    total_amount: Optional[float] = None
-    date_of_service: Optional[str] = None
+    hospital_name: str = Field(..., min_length=1)
+    total_amount: float
+    date_of_service: str = Field(..., min_length=1)
     patient_name: Optional[str] = None
     services: List[str] = Field(default_factory=list)
     insurance_id: Optional[str] = None
 
+    @validator('services', pre=True)
+    def default_services(cls, value):
+        # Extraction prompts return null for fields they cannot find
+        return [] if value is None else value
+
 class DischargeSummaryDocument(BaseModel):
     type: DocumentType = DocumentType.DISCHARGE_SUMMARY
-    patient_name: Optional[str] = None
-    diagnosis: Optional[str] = None
-    admission_date: Optional[str] = None
-    discharge_date: Optional[str] = None
+    patient_name: str = Field(..., min_length=1)
+    diagnosis: str = Field(..., min_length=1)
+    admission_date: str = Field(..., min_length=1)
+    discharge_date: str = Field(..., min_length=1)
     treating_physician: Optional[str] = None
     hospital_name: Optional[str] = None
     procedures: List[str] = Field(default_factory=list)
 
+    @validator('procedures', pre=True)
+    def default_procedures(cls, value):
+        # Extraction prompts return null for fields they cannot find
+        return [] if value is None else value
+
+    @root_validator(skip_on_failure=True)
+    def check_date_order(cls, values):
+        if values['admission_date'] > values['discharge_date']:
+            raise ValueError("Admission date is after discharge date")
+        return values
+
 class IDCardDocument(BaseModel):
     type: DocumentType = DocumentType.ID_CARD
-    patient_name: Optional[str] = None
-    insurance_id: Optional[str] = None
-    policy_number: Optional[str] = None
+    patient_name: str = Field(..., min_length=1)
+    insurance_id: str = Field(..., min_length=1)
+    policy_number: str = Field(..., min_length=1)
     group_number: Optional[str] = None
     effective_date: Optional[str] = None
     expiration_date: Optional[str] = None
@@ -67,4 +90,17 @@ class ClaimProcessingResponse(BaseModel):
     validation: ValidationResult
     claim_decision: ClaimDecision
     processing_time: float
-    processed_at: datetime = Field(default_factory=datetime.now)
\ No newline at end of file
+    processed_at: datetime = Field(default_factory=datetime.now)
+
+@dataclass(slots=True)
+class DocumentCtx:
+    """Per-document state carried through the processing pipeline"""
+    filename: str
+    text: str
+    size: int
+    type: str = 'unknown'
+    confidence: float = 0.0
+    extracted_data: Dict[str, Any] = field(default_factory=dict)
+    validation_errors: List[str] = field(default_factory=list)
+    processing_status: str = ''
+    cache_hit: bool = False
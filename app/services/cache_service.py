@@ -0,0 +1,166 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever prompt text changes so stale responses are no longer served
+PROMPT_VERSION = "v4"
+
+DEFAULT_TTL = 7 * 86400
+
+_skip_cache = contextvars.ContextVar("skip_llm_cache", default=False)
+
+
+def skip_cache():
+    """Mark the response of the current cached call as not cacheable (e.g. an error fallback)"""
+    _skip_cache.set(True)
+
+
+def make_cache_key(version: str, namespace: str, *parts: Any) -> str:
+    """Build a SHA-256 key from the prompt version, method namespace and inputs"""
+    hasher = hashlib.sha256()
+    hasher.update(version.encode())
+    hasher.update(b"\x00")
+    hasher.update(namespace.encode())
+    for part in parts:
+        hasher.update(b"\x00")
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True, default=str)
+        hasher.update(part.encode())
+    return hasher.hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (in-memory LRU + SQLite) cache for serialized LLM responses"""
+
+    def __init__(self, path: str, memory_size: int = 256):
+        self.path = path
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(hash TEXT PRIMARY KEY, response TEXT, expires_at INTEGER)"
+            )
+            self._initialized = True
+        return conn
+
+    def _remember(self, key: str, response: str, expires_at: int):
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        now = int(time.time())
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT response, expires_at FROM llm_cache WHERE hash = ?", (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+
+            if row is None or row[1] <= now:
+                return None
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def _set_sync(self, key: str, response: str, ttl: int):
+        expires_at = int(time.time()) + ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (hash, response, expires_at) VALUES (?, ?, ?)",
+                        (key, response, expires_at)
+                    )
+            finally:
+                conn.close()
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            response = await asyncio.to_thread(self._get_sync, key)
+        except Exception as e:
+            logger.error(f"LLM cache read error: {str(e)}")
+            return None
+        return json.loads(response) if response is not None else None
+
+    async def set(self, key: str, value: Any, ttl: int = DEFAULT_TTL):
+        try:
+            await asyncio.to_thread(self._set_sync, key, json.dumps(value), ttl)
+        except Exception as e:
+            logger.error(f"LLM cache write error: {str(e)}")
+
+
+response_cache = ResponseCache(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"))
+
+
+def cached(version: str = PROMPT_VERSION, ttl: int = DEFAULT_TTL) -> Callable:
+    """
+    Cache the dict result of an async LLMService method keyed on its inputs
+
+    The returned dict carries a `cache_hit` flag. Calls that invoke `skip_cache()`
+    (error fallbacks) are not stored, and non-dict results are replaced by an
+    empty dict without being stored.
+    """
+    def decorator(func):
+        namespace = func.__qualname__
+
+        def cache_key(*args, **kwargs) -> str:
+            return make_cache_key(version, namespace, *args, *sorted(kwargs.items()))
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            key = cache_key(*args, **kwargs)
+
+            result = await response_cache.get(key)
+            if isinstance(result, dict):
+                result['cache_hit'] = True
+                return result
+
+            token = _skip_cache.set(False)
+            try:
+                result = await func(self, *args, **kwargs)
+                if not isinstance(result, dict):
+                    # e.g. the LLM answered with a JSON array; never persist it
+                    logger.warning(f"{namespace} returned {type(result).__name__}, expected dict")
+                    skip_cache()
+                    result = {}
+                if not _skip_cache.get():
+                    await response_cache.set(key, result, ttl)
+            finally:
+                _skip_cache.reset(token)
+
+            result['cache_hit'] = False
+            return result
+
+        wrapper.cache_key = cache_key
+        wrapper.ttl = ttl
+        return wrapper
+    return decorator
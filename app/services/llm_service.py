@@ -1,53 +1,523 @@
 import google.generativeai as genai
+from google.api_core.exceptions import DeadlineExceeded, InternalServerError, ResourceExhausted, ServiceUnavailable
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from aiolimiter import AsyncLimiter
 import os
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import json
+import orjson
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from app.services.cache_service import cached, response_cache, skip_cache
+from app.services.validation_service import rule_based_validate
 
 logger = logging.getLogger(__name__)
 
+# Field templates shown to the LLM in the extraction prompts, keyed by document type
+EXTRACTION_SCHEMAS = {
+    'bill': """{
+            "hospital_name": "Name of hospital/provider",
+            "total_amount": 12500.00,
+            "date_of_service": "2024-04-10",
+            "patient_name": "Patient Name",
+            "services": ["Service 1", "Service 2"],
+            "insurance_id": "Insurance ID if present"
+        }""",
+    'discharge_summary': """{
+            "patient_name": "Patient Name",
+            "diagnosis": "Primary diagnosis",
+            "admission_date": "2024-04-01",
+            "discharge_date": "2024-04-10",
+            "treating_physician": "Doctor Name",
+            "hospital_name": "Hospital Name",
+            "procedures": ["Procedure 1", "Procedure 2"]
+        }""",
+    'id_card': """{
+            "patient_name": "Patient Name",
+            "insurance_id": "Member ID",
+            "policy_number": "Policy Number",
+            "group_number": "Group Number",
+            "effective_date": "2024-01-01",
+            "expiration_date": "2024-12-31"
+        }""",
+}
+
+# Token budgets for document text sent to the LLM. Gemini's tokenizer is not
+# available offline, so tokens are approximated as 4 characters.
+CHARS_PER_TOKEN = 4
+EXTRACT_HEAD_TOKENS = 1500
+EXTRACT_TAIL_TOKENS = 500
+
+# Standalone footer lines that carry no claim information: page numbers, a bare
+# confidentiality marker, and short copyright notices without any label: value content
+_BOILERPLATE_LINE = re.compile(
+    r"^[ \t]*(?:page \d+(?: of \d+)?|confidential|(?:©|\(c\)|copyright\b)[^:\n]{0,80})[ \t.]*$",
+    re.I | re.M
+)
+_INLINE_SPACE = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+# Discharge summaries are truncated to the window densest in these terms
+DISCHARGE_FOCUS = re.compile(r"diagnosis|discharge|admission", re.I)
+# How far a focus window may move back to start on a line boundary
+FOCUS_SNAP_CHARS = 200
+
+def _compact_text(text: str, max_chars: Optional[int] = None, focus: Optional[re.Pattern] = None) -> str:
+    """
+    Drop boilerplate lines and redundant whitespace from document text
+    
+    If `max_chars` is given, the result is cut to that length, keeping the window
+    with the most `focus` matches when a pattern is given, or the beginning otherwise.
+    """
+    text = _BOILERPLATE_LINE.sub("", text)
+    text = _INLINE_SPACE.sub(" ", text)
+    text = _BLANK_LINES.sub("\n", text).strip()
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    
+    matches = [m.start() for m in focus.finditer(text)] if focus is not None else []
+    if not matches:
+        return text[:max_chars]
+    
+    best_start, best_count = 0, 0
+    for i, start in enumerate(matches):
+        count = bisect_left(matches, start + max_chars) - i
+        if count > best_count:
+            best_start, best_count = start, count
+    # Start the window at the beginning of the line holding the first match, unless
+    # that line starts so far back that the window would lose the matches
+    snap_limit = max(0, best_start - min(FOCUS_SNAP_CHARS, max_chars // 4))
+    line_start = text.rfind("\n", snap_limit, best_start)
+    if line_start != -1:
+        best_start = line_start + 1
+    return text[best_start:best_start + max_chars]
+
+# Number of raw Gemini responses kept in memory, keyed by exact prompt hash
+PROMPT_CACHE_SIZE = 1024
+
+EXTRACTION_LABELS = {
+    'bill': 'medical bill',
+    'discharge_summary': 'discharge summary',
+    'id_card': 'insurance ID card',
+}
+
+def _extraction_prompt_prefix(doc_type: str) -> str:
+    """Build the static part of a single-document extraction prompt; the document text is appended last"""
+    return f"""
+        Extract key information from this {EXTRACTION_LABELS[doc_type]} document.
+        
+        Extract the following information and return as JSON:
+        {EXTRACTION_SCHEMAS[doc_type]}
+        
+        If information is not found, use null for that field.
+        IMPORTANT: Return ONLY valid JSON, no other text.
+        
+        Document text:
+        """
+
+# Built once at import; each call only appends the document text
+_BILL_PROMPT_PREFIX = _extraction_prompt_prefix('bill')
+_DISCHARGE_PROMPT_PREFIX = _extraction_prompt_prefix('discharge_summary')
+_IDCARD_PROMPT_PREFIX = _extraction_prompt_prefix('id_card')
+# Per-type field templates listed in the classify-and-extract prompts
+_TYPE_SCHEMAS = "\n".join(
+    f"""
+        {doc_type}:
+        {schema}
+        """
+    for doc_type, schema in EXTRACTION_SCHEMAS.items()
+)
+
+# Response schemas (Gemini's OpenAPI subset) that constrain JSON-mode output
+_NULLABLE_STRING = {"type": "string", "nullable": True}
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+BILL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "hospital_name": _NULLABLE_STRING,
+        "total_amount": {"type": "number", "nullable": True},
+        "date_of_service": _NULLABLE_STRING,
+        "patient_name": _NULLABLE_STRING,
+        "services": _STRING_LIST,
+        "insurance_id": _NULLABLE_STRING,
+    },
+}
+
+DISCHARGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "patient_name": _NULLABLE_STRING,
+        "diagnosis": _NULLABLE_STRING,
+        "admission_date": _NULLABLE_STRING,
+        "discharge_date": _NULLABLE_STRING,
+        "treating_physician": _NULLABLE_STRING,
+        "hospital_name": _NULLABLE_STRING,
+        "procedures": _STRING_LIST,
+    },
+}
+
+ID_CARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "patient_name": _NULLABLE_STRING,
+        "insurance_id": _NULLABLE_STRING,
+        "policy_number": _NULLABLE_STRING,
+        "group_number": _NULLABLE_STRING,
+        "effective_date": _NULLABLE_STRING,
+        "expiration_date": _NULLABLE_STRING,
+    },
+}
+
+CLASSIFICATION_TYPES = ("bill", "discharge_summary", "id_card", "unknown")
+
+CLASSIFY_AND_EXTRACT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": list(CLASSIFICATION_TYPES)},
+        "confidence": {"type": "number"},
+        "reasoning": {"type": "string"},
+        # Union of the per-type fields; the agent's Pydantic model keeps only its own
+        "extracted": {
+            "type": "object",
+            "properties": {
+                **BILL_SCHEMA["properties"],
+                **DISCHARGE_SCHEMA["properties"],
+                **ID_CARD_SCHEMA["properties"],
+            },
+        },
+    },
+    "required": ["type", "confidence", "reasoning", "extracted"],
+}
+
+# One classification per document, numbered so results map back to the input order
+CLASSIFY_AND_EXTRACT_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        **CLASSIFY_AND_EXTRACT_SCHEMA,
+        "properties": {"index": {"type": "integer"}, **CLASSIFY_AND_EXTRACT_SCHEMA["properties"]},
+        "required": ["index", *CLASSIFY_AND_EXTRACT_SCHEMA["required"]],
+    },
+}
+
+VALIDATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "missing_documents": _STRING_LIST,
+        "discrepancies": _STRING_LIST,
+        "data_quality_issues": _STRING_LIST,
+        "validation_passed": {"type": "boolean"},
+    },
+    "required": ["missing_documents", "discrepancies", "data_quality_issues", "validation_passed"],
+}
+
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "status": {"type": "string", "enum": ["approved", "rejected", "requires_review"]},
+        "reason": {"type": "string"},
+        "confidence": {"type": "number"},
+        "recommended_actions": _STRING_LIST,
+    },
+    "required": ["status", "reason", "confidence", "recommended_actions"],
+}
+
+VALIDATE_AND_DECIDE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "validation": VALIDATION_SCHEMA,
+        "decision": DECISION_SCHEMA,
+    },
+    "required": ["validation", "decision"],
+}
+
+def _is_json(response: str, expect: type) -> bool:
+    """Check that a response parses as JSON with the expected top-level type"""
+    try:
+        return isinstance(orjson.loads(response), expect)
+    except orjson.JSONDecodeError:
+        return False
+
+def _is_classification(item: Any) -> bool:
+    """Check that a classify-and-extract result has the fields its callers rely on"""
+    return (
+        isinstance(item, dict)
+        and item.get('type') in CLASSIFICATION_TYPES
+        and isinstance(item.get('confidence'), (int, float))
+        and not isinstance(item.get('confidence'), bool)
+        and isinstance(item.get('extracted'), dict)
+    )
+
+def _parse_json(response: str) -> Any:
+    """Parse a JSON-mode LLM response"""
+    return orjson.loads(response)
+
+# Failures worth retrying quickly: stuck calls cut off by the request timeout
+# and transient server-side errors
+TRANSIENT_ERRORS = (asyncio.TimeoutError, DeadlineExceeded, InternalServerError, ServiceUnavailable)
+
+@functools.lru_cache(maxsize=1)
+def _get_model() -> genai.GenerativeModel:
+    """Configure the Gemini client once per process and return the shared model"""
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable not set")
+    
+    # genai.configure mutates module-global client state, so it must only run once
+    genai.configure(api_key=api_key)
+    # Updated to use the current available model
+    return genai.GenerativeModel('gemini-1.5-flash')
+
 class LLMService:
-    def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable not set")
-        
-        genai.configure(api_key=api_key)
-        # Updated to use the current available model
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-        self.executor = ThreadPoolExecutor(max_workers=5)
+    def __init__(self, request_timeout: Optional[float] = None):
+        self.model = _get_model()
+        # Shared cap on in-flight LLM requests across all documents and stages,
+        # sized to stay under the provider's requests/tokens per minute budget
+        self._llm_sem = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+        self._llm_waiting = 0
+        # Token bucket that keeps outbound requests under the provider's per-minute
+        # quota, so bursts queue here instead of failing with 429s
+        self._limiter = AsyncLimiter(max_rate=int(os.getenv("LLM_MAX_RPM", "300")), time_period=60)
+        self._prompt_cache: "OrderedDict[str, str]" = OrderedDict()
+        # Futures of Gemini calls in progress, keyed like the prompt cache, so
+        # identical concurrent prompts share one outbound call
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Seconds before a Gemini call is abandoned and retried
+        self.request_timeout = request_timeout or float(os.getenv("LLM_REQUEST_TIMEOUT", "20"))
+    
+    def truncate(self, text: str, head_tokens: int, tail_tokens: int = 0, focus: Optional[re.Pattern] = None) -> str:
+        """
+        Compact a document and keep the first `head_tokens` and last `tail_tokens` tokens
+        
+        With a `focus` pattern, the densest window of the same total size is kept instead.
+        """
+        text = _compact_text(text)
+        head_chars = head_tokens * CHARS_PER_TOKEN
+        tail_chars = tail_tokens * CHARS_PER_TOKEN
+        if len(text) <= head_chars + tail_chars:
+            return text
+        
+        if focus is not None:
+            truncated = _compact_text(text, head_chars + tail_chars, focus)
+        else:
+            truncated = text[:head_chars]
+            if tail_chars:
+                truncated += "\n...\n" + text[-tail_chars:]
+        
+        logger.debug(
+            "Truncated document text: ~%d -> ~%d tokens", len(text) // CHARS_PER_TOKEN, len(truncated) // CHARS_PER_TOKEN
+        )
+        return truncated
+    
+    async def generate_async(self, prompt: str, temperature: float = 0.1, cache: bool = True,
+                             schema: Optional[Dict[str, Any]] = None, expect: type = dict) -> str:
+        """
+        Async wrapper for Gemini API calls
+        
+        Gemini runs in JSON mode, so the response is always a JSON document; `schema`
+        optionally constrains it further. Responses are kept in an in-memory LRU keyed
+        by the exact prompt and temperature, so repeated prompts (re-runs, duplicate
+        uploads) skip Gemini, and identical prompts already in flight share that call.
+        Only responses that parse as JSON of type `expect` are cached. Pass
+        `cache=False` to always call the model.
+        """
+        return await self._generate_cached(prompt, temperature, cache, schema, expect, None, False)
+    
+    async def generate_stream_async(self, prompt: str, temperature: float = 0.1, cache: bool = True,
+                                    schema: Optional[Dict[str, Any]] = None, expect: type = dict,
+                                    on_chunk: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Streaming variant of `generate_async` for long generations
+        
+        Text chunks are passed to `on_chunk` as they arrive and the full response is
+        returned once the stream ends. The request timeout bounds the whole stream, so
+        a stalled generation is cut off mid-stream. If the call is retried, `on_chunk`
+        sees the new stream from its start.
+        """
+        return await self._generate_cached(prompt, temperature, cache, schema, expect, on_chunk, True)
     
-    async def generate_async(self, prompt: str, temperature: float = 0.1) -> str:
-        """Async wrapper for Gemini API calls"""
-        loop = asyncio.get_event_loop()
+    async def _generate_cached(self, prompt: str, temperature: float, cache: bool,
+                               schema: Optional[Dict[str, Any]], expect: type,
+                               on_chunk: Optional[Callable[[str], None]], stream: bool) -> str:
+        if not cache:
+            return await self._generate_limited(prompt, temperature, schema, on_chunk, stream)
+        
+        key = hashlib.sha256(f"{temperature}:{prompt}".encode()).hexdigest()
+        while True:
+            if key in self._prompt_cache:
+                self._prompt_cache.move_to_end(key)
+                response = self._prompt_cache[key]
+            elif key in self._inflight:
+                inflight = self._inflight[key]
+                try:
+                    response = await asyncio.shield(inflight)
+                except asyncio.CancelledError:
+                    if not inflight.cancelled():
+                        raise
+                    # The call we were waiting on was cancelled; reuse, join or make a new one
+                    continue
+            else:
+                break
+            if on_chunk is not None:
+                on_chunk(response)
+            return response
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await self._generate_limited(prompt, temperature, schema, on_chunk, stream)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        
+        future.set_result(response)
+        # Truncated or malformed output must not be pinned, so a retry asks Gemini again
+        if not _is_json(response, expect):
+            logger.warning("Not caching LLM response that is not a JSON %s", expect.__name__)
+            return response
+        
+        self._prompt_cache[key] = response
+        while len(self._prompt_cache) > PROMPT_CACHE_SIZE:
+            self._prompt_cache.popitem(last=False)
+        return response
+    
+    @retry(
+        wait=wait_exponential_jitter(initial=1, max=30),
+        retry=retry_if_exception_type(ResourceExhausted),
+        stop=stop_after_attempt(5),
+        reraise=True
+    )
+    @retry(
+        wait=wait_exponential_jitter(initial=0.5, max=4),
+        retry=retry_if_exception_type(TRANSIENT_ERRORS),
+        stop=stop_after_attempt(3),
+        reraise=True
+    )
+    async def _generate_limited(self, prompt: str, temperature: float, schema: Optional[Dict[str, Any]],
+                                on_chunk: Optional[Callable[[str], None]] = None, stream: bool = False) -> str:
+        """Call Gemini under the shared rate and concurrency limits"""
+        # Wait for a rate-limit token before taking a concurrency slot, so throttled
+        # requests do not hold slots. Every retry spends a token of its own
+        if not self._limiter.has_capacity():
+            logger.debug("LLM rate limit reached, waiting for capacity")
+        await self._limiter.acquire()
+        
+        if self._llm_sem.locked():
+            logger.debug("LLM concurrency limit reached, %d requests queued", self._llm_waiting + 1)
+        
+        self._llm_waiting += 1
+        try:
+            await self._llm_sem.acquire()
+        finally:
+            self._llm_waiting -= 1
         
+        try:
+            if stream:
+                return await self._stream_model(prompt, temperature, schema, on_chunk)
+            return await self._call_model(prompt, temperature, schema)
+        finally:
+            self._llm_sem.release()
+    
+    def _generation_config(self, temperature: float, schema: Optional[Dict[str, Any]]):
+        return genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=2048,
+            response_mime_type="application/json",
+            response_schema=schema,
+        )
+    
+    async def _call_model(self, prompt: str, temperature: float, schema: Optional[Dict[str, Any]]) -> str:
         def _generate():
             try:
                 response = self.model.generate_content(
                     prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=temperature,
-                        max_output_tokens=2048,
-                    )
+                    generation_config=self._generation_config(temperature, schema),
+                    # Lets the worker thread give up too, not just the awaiting coroutine
+                    request_options={"timeout": self.request_timeout}
                 )
                 return response.text
             except Exception as e:
                 logger.error(f"LLM generation error: {str(e)}")
                 raise
         
-        return await loop.run_in_executor(self.executor, _generate)
+        # Runs on the loop's shared default executor (configured at app startup)
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(_generate), timeout=self.request_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"LLM call timed out after {self.request_timeout}s")
+            raise
     
-    async def classify_document(self, text: str, filename: str) -> Dict[str, Any]:
-        """Classify document type using LLM"""
+    async def _stream_model(self, prompt: str, temperature: float, schema: Optional[Dict[str, Any]],
+                            on_chunk: Optional[Callable[[str], None]]) -> str:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+        
+        def _pump():
+            # Forward chunks from the blocking stream iterator to the event loop
+            try:
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config=self._generation_config(temperature, schema),
+                    stream=True,
+                    request_options={"timeout": self.request_timeout}
+                )
+                for chunk in response:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+        
+        pump = asyncio.create_task(asyncio.to_thread(_pump))
+        parts = []
+        try:
+            async with asyncio.timeout(self.request_timeout):
+                while (item := await queue.get()) is not done:
+                    if isinstance(item, Exception):
+                        logger.error(f"LLM generation error: {str(item)}")
+                        raise item
+                    parts.append(item)
+                    if on_chunk is not None:
+                        on_chunk(item)
+        except asyncio.TimeoutError:
+            logger.warning(f"LLM stream timed out after {self.request_timeout}s")
+            raise
+        finally:
+            # Lets the worker thread stop at the next chunk if we gave up early
+            stop.set()
+        
+        await pump
+        return "".join(parts)
+    
+    @cached()
+    async def classify_and_extract(self, text: str, filename: str) -> Dict[str, Any]:
+        """Classify document type and extract its structured data in a single LLM call"""
         prompt = f"""
-        Analyze the following document text and filename to classify the document type.
+        Analyze the following document text and filename, classify the document type
+        and extract its key information.
         
         Filename: {filename}
         
-        Document Text (first 1000 chars):
-        {text[:1000]}
+        Document Text:
+        {self.truncate(text, EXTRACT_HEAD_TOKENS, EXTRACT_TAIL_TOKENS)}
         
         Classify this document as one of:
         - bill: Medical bill or invoice
@@ -55,147 +525,195 @@ class LLMService:
         - id_card: Insurance ID card
         - unknown: Cannot determine type
         
+        Then extract the information for the chosen type only, using its schema:
+        {_TYPE_SCHEMAS}
+        If information is not found, use null for that field. For unknown documents use an empty object.
+        
         Return a JSON response with:
         {{
             "type": "document_type",
             "confidence": 0.95,
-            "reasoning": "Brief explanation of classification"
+            "reasoning": "Brief explanation of classification",
+            "extracted": {{"...": "fields from the schema of the chosen type"}}
         }}
         
         IMPORTANT: Return ONLY valid JSON, no other text.
         """
         
         try:
-            response = await self.generate_async(prompt)
-            # Clean the response to extract JSON
-            response_text = response.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            result = json.loads(response_text)
-            return result
+            response = await self.generate_async(prompt, schema=CLASSIFY_AND_EXTRACT_SCHEMA)
+            return _parse_json(response)
         except Exception as e:
-            logger.error(f"Document classification error: {str(e)}")
+            logger.error(f"Document classification and extraction error: {str(e)}")
+            skip_cache()
             return {
                 "type": "unknown",
                 "confidence": 0.0,
-                "reasoning": f"Classification failed: {str(e)}"
+                "reasoning": f"Classification failed: {str(e)}",
+                "extracted": {}
             }
     
-    async def extract_bill_data(self, text: str) -> Dict[str, Any]:
-        """Extract structured data from medical bill"""
+    async def classify_document(self, text: str, filename: str) -> Dict[str, Any]:
+        """Classify document type using LLM
+        
+        Deprecated: use classify_and_extract, which also returns the extracted
+        fields in the same call. This returns its result without them.
+        """
+        result = await self.classify_and_extract(text, filename)
+        return {key: value for key, value in result.items() if key != 'extracted'}
+    
+    async def classify_and_extract_batch(self, documents: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Classify and extract several (text, filename) documents with a single LLM call
+        
+        Results are returned in the same order as the input documents. Documents
+        missing from the batched response are retried individually.
+        """
+        return await self._run_cached_batch(
+            self.classify_and_extract,
+            documents,
+            self._classify_and_extract_batch
+        )
+    
+    async def _classify_and_extract_batch(self, documents: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """Send (text, filename) pairs to the LLM as one numbered prompt"""
+        sections = "\n        ---\n".join(
+            f"""
+        Document {i} (filename={filename}):
+        {self.truncate(text, EXTRACT_HEAD_TOKENS, EXTRACT_TAIL_TOKENS)}
+        """
+            for i, (text, filename) in enumerate(documents, start=1)
+        )
         prompt = f"""
-        Extract key information from this medical bill document:
+        Analyze the following {len(documents)} documents. For each one, classify the document
+        type and extract its key information.
+        {sections}
+        Classify each document as one of:
+        - bill: Medical bill or invoice
+        - discharge_summary: Hospital discharge summary
+        - id_card: Insurance ID card
+        - unknown: Cannot determine type
         
-        {text}
+        Then extract the information for the chosen type only, using its schema:
+        {_TYPE_SCHEMAS}
+        If information is not found, use null for that field. For unknown documents use an empty object.
+        
+        Return a JSON array with one entry per document:
+        [
+            {{
+                "index": 1,
+                "type": "document_type",
+                "confidence": 0.95,
+                "reasoning": "Brief explanation of classification",
+                "extracted": {{"...": "fields from the schema of the chosen type"}}
+            }}
+        ]
+        
+        IMPORTANT: Return ONLY a valid JSON array, no other text.
+        """
         
-        Extract the following information and return as JSON:
-        {{
-            "hospital_name": "Name of hospital/provider",
-            "total_amount": 12500.00,
-            "date_of_service": "2024-04-10",
-            "patient_name": "Patient Name",
-            "services": ["Service 1", "Service 2"],
-            "insurance_id": "Insurance ID if present"
-        }}
+        results_by_index = {}
+        try:
+            response = await self.generate_async(prompt, schema=CLASSIFY_AND_EXTRACT_BATCH_SCHEMA, expect=list)
+            for item in _parse_json(response):
+                # Anything malformed is left to the per-document fallback, so it never
+                # reaches the per-document cache keys
+                if _is_classification(item) and isinstance(item.get('index'), int):
+                    results_by_index[item.pop('index')] = item
+        except Exception as e:
+            logger.warning(f"Batched classification failed, falling back to per-document calls: {str(e)}")
         
-        If information is not found, use null for that field.
-        IMPORTANT: Return ONLY valid JSON, no other text.
+        missing = [i for i in range(1, len(documents) + 1) if i not in results_by_index]
+        if missing:
+            retried = await asyncio.gather(
+                *[self.classify_and_extract(*documents[i - 1]) for i in missing]
+            )
+            results_by_index.update(zip(missing, retried))
+        
+        return [results_by_index[i] for i in range(1, len(documents) + 1)]
+    
+    async def _run_cached_batch(self, single_method, inputs: List[tuple], batch_call) -> List[Dict[str, Any]]:
+        """
+        Serve batch entries from the response cache of `single_method` and send only
+        the misses to `batch_call`, storing fresh results under the same keys
         """
+        if not inputs:
+            return []
+        
+        keys = [single_method.cache_key(*args) for args in inputs]
+        results = list(await asyncio.gather(*[response_cache.get(key) for key in keys]))
+        # Like the cached() decorator, treat non-dict (legacy) entries as misses
+        results = [result if isinstance(result, dict) else None for result in results]
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        for result in results:
+            if result is not None:
+                result['cache_hit'] = True
+        
+        if pending:
+            fresh = await batch_call([inputs[i] for i in pending])
+            writes = []
+            for i, result in zip(pending, fresh):
+                # Results from the per-document fallback are already cached and flagged
+                if 'cache_hit' not in result:
+                    writes.append(response_cache.set(keys[i], dict(result), single_method.ttl))
+                    result['cache_hit'] = False
+                results[i] = result
+            await asyncio.gather(*writes)
+        
+        return results
+    
+    @cached()
+    async def extract_bill_data(self, text: str) -> Dict[str, Any]:
+        """Extract structured data from medical bill"""
+        prompt = _BILL_PROMPT_PREFIX + text
         
         try:
-            response = await self.generate_async(prompt)
-            # Clean the response to extract JSON
-            response_text = response.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            return json.loads(response_text)
+            response = await self.generate_async(prompt, schema=BILL_SCHEMA)
+            return _parse_json(response)
         except Exception as e:
             logger.error(f"Bill extraction error: {str(e)}")
+            skip_cache()
             return {}
     
+    @cached()
     async def extract_discharge_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data from discharge summary"""
-        prompt = f"""
-        Extract key information from this discharge summary document:
-        
-        {text}
-        
-        Extract the following information and return as JSON:
-        {{
-            "patient_name": "Patient Name",
-            "diagnosis": "Primary diagnosis",
-            "admission_date": "2024-04-01",
-            "discharge_date": "2024-04-10",
-            "treating_physician": "Doctor Name",
-            "hospital_name": "Hospital Name",
-            "procedures": ["Procedure 1", "Procedure 2"]
-        }}
-        
-        If information is not found, use null for that field.
-        IMPORTANT: Return ONLY valid JSON, no other text.
-        """
+        prompt = _DISCHARGE_PROMPT_PREFIX + text
         
         try:
-            response = await self.generate_async(prompt)
-            # Clean the response to extract JSON
-            response_text = response.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            return json.loads(response_text)
+            response = await self.generate_async(prompt, schema=DISCHARGE_SCHEMA)
+            return _parse_json(response)
         except Exception as e:
             logger.error(f"Discharge summary extraction error: {str(e)}")
+            skip_cache()
             return {}
     
+    @cached()
     async def extract_id_card_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data from insurance ID card"""
-        prompt = f"""
-        Extract key information from this insurance ID card document:
-        
-        {text}
-        
-        Extract the following information and return as JSON:
-        {{
-            "patient_name": "Patient Name",
-            "insurance_id": "Member ID",
-            "policy_number": "Policy Number",
-            "group_number": "Group Number",
-            "effective_date": "2024-01-01",
-            "expiration_date": "2024-12-31"
-        }}
-        
-        If information is not found, use null for that field.
-        IMPORTANT: Return ONLY valid JSON, no other text.
-        """
+        prompt = _IDCARD_PROMPT_PREFIX + text
         
         try:
-            response = await self.generate_async(prompt)
-            # Clean the response to extract JSON
-            response_text = response.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            return json.loads(response_text)
+            response = await self.generate_async(prompt, schema=ID_CARD_SCHEMA)
+            return _parse_json(response)
         except Exception as e:
             logger.error(f"ID card extraction error: {str(e)}")
+            skip_cache()
             return {}
     
+    @cached()
     async def validate_claim_data(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Validate claim data for consistency and completeness"""
+        result = rule_based_validate(documents)
+        if result is not None and not result['discrepancies']:
+            # Names and dates agree, so there is nothing left for the LLM to reconcile
+            skip_cache()
+            return result
+        
         prompt = f"""
         Analyze these processed claim documents for validation:
         
-        {json.dumps(documents, indent=2)}
+        {json.dumps(documents, separators=(",", ":"))}
         
         Check for:
         1. Missing required documents (bill, discharge summary recommended)
@@ -214,17 +732,11 @@ class LLMService:
         """
         
         try:
-            response = await self.generate_async(prompt)
-            # Clean the response to extract JSON
-            response_text = response.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            return json.loads(response_text)
+            response = await self.generate_stream_async(prompt, schema=VALIDATION_SCHEMA)
+            return _parse_json(response)
         except Exception as e:
             logger.error(f"Validation error: {str(e)}")
+            skip_cache()
             return {
                 "missing_documents": [],
                 "discrepancies": [f"Validation failed: {str(e)}"],
@@ -232,16 +744,17 @@ class LLMService:
                 "validation_passed": False
             }
     
+    @cached()
     async def make_claim_decision(self, documents: List[Dict[str, Any]], validation: Dict[str, Any]) -> Dict[str, Any]:
         """Make final claim decision based on processed data"""
         prompt = f"""
         Make a claim decision based on the processed documents and validation results:
         
         Documents:
-        {json.dumps(documents, indent=2)}
+        {json.dumps(documents, separators=(",", ":"))}
         
         Validation Results:
-        {json.dumps(validation, indent=2)}
+        {json.dumps(validation, separators=(",", ":"))}
         
         Decision criteria:
         - Approve if all required documents present and no major discrepancies
@@ -260,20 +773,72 @@ class LLMService:
         """
         
         try:
-            response = await self.generate_async(prompt)
-            # Clean the response to extract JSON
-            response_text = response.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            return json.loads(response_text)
+            response = await self.generate_stream_async(prompt, schema=DECISION_SCHEMA)
+            return _parse_json(response)
         except Exception as e:
             logger.error(f"Decision making error: {str(e)}")
+            skip_cache()
             return {
                 "status": "requires_review",
                 "reason": f"Decision making failed: {str(e)}",
                 "confidence": 0.0,
                 "recommended_actions": ["Manual review required"]
-            }
\ No newline at end of file
+            }
+    
+    @cached()
+    async def validate_and_decide(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Validate claim data and make the claim decision in a single LLM call"""
+        prompt = f"""
+        Analyze these processed claim documents, validate them and make a claim decision:
+        
+        {json.dumps(documents, separators=(",", ":"))}
+        
+        Validation - check for:
+        1. Missing required documents (bill, discharge summary recommended)
+        2. Data inconsistencies between documents (dates, names, amounts)
+        3. Data quality issues (missing critical fields)
+        
+        Decision criteria, based on your validation:
+        - Approve if all required documents present and no major discrepancies
+        - Reject if critical information missing or major discrepancies found
+        - Require review if minor issues that need human attention
+        
+        Return both results as JSON:
+        {{
+            "validation": {{
+                "missing_documents": ["document_type1", "document_type2"],
+                "discrepancies": ["Description of discrepancy 1"],
+                "data_quality_issues": ["Missing critical field X"],
+                "validation_passed": true
+            }},
+            "decision": {{
+                "status": "approved|rejected|requires_review",
+                "reason": "Detailed explanation of decision",
+                "confidence": 0.95,
+                "recommended_actions": ["Action 1", "Action 2"]
+            }}
+        }}
+        
+        IMPORTANT: Return ONLY valid JSON, no other text.
+        """
+        
+        try:
+            response = await self.generate_stream_async(prompt, schema=VALIDATE_AND_DECIDE_SCHEMA)
+            return _parse_json(response)
+        except Exception as e:
+            logger.error(f"Validation and decision error: {str(e)}")
+            skip_cache()
+            return {
+                "validation": {
+                    "missing_documents": [],
+                    "discrepancies": [f"Validation failed: {str(e)}"],
+                    "data_quality_issues": [],
+                    "validation_passed": False
+                },
+                "decision": {
+                    "status": "requires_review",
+                    "reason": f"Decision making failed: {str(e)}",
+                    "confidence": 0.0,
+                    "recommended_actions": ["Manual review required"]
+                }
+            }
@@ -1,41 +1,183 @@
-import PyPDF2
+import pypdfium2 as pdfium
 import logging
-from typing import Optional
-import io
+from typing import Optional, Tuple
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# OCR for scanned PDFs is optional (needs pytesseract, Pillow and the tesseract binary)
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
 
 logger = logging.getLogger(__name__)
 
+# PDFs with less extracted text than this are treated as scans without a text layer
+OCR_MIN_CHARS = int(os.getenv("PDF_OCR_MIN_CHARS", "32"))
+# Render scale for OCR (1.0 = 72 dpi)
+OCR_RENDER_SCALE = 300 / 72
+
+PDF_MAGIC = b"%PDF-"
+PDF_HEADER_SCAN = 1024
+
+# Worker processes used for parsing, per server process
+PDF_MAX_PARALLEL = int(os.getenv("PDF_MAX_PARALLEL", str(os.cpu_count() or 1)))
+# Seconds before extraction of a single PDF is abandoned
+PDF_EXTRACT_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "60"))
+# The first worker parses this many leading pages and reports the page count; only
+# longer PDFs are split across more workers, since splitting short ones costs more than it saves
+PARALLEL_MIN_PAGES = 4
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Return the process pool shared by all PDFService instances"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PDF_MAX_PARALLEL)
+    return _process_pool
+
+def _retire_process_pool(pool: ProcessPoolExecutor):
+    """Stop handing work to `pool`; the next caller gets a fresh one"""
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    # Work already queued on the old pool still runs there
+    pool.shutdown(wait=False)
+
+def _terminate_process_pool(pool: ProcessPoolExecutor):
+    """Retire `pool` and kill its workers, e.g. one stuck on a pathological PDF"""
+    # ProcessPoolExecutor has no public way to stop a running task; on Python 3.11
+    # the worker processes are only reachable through _processes
+    processes = [process for process in (pool._processes or {}).values() if process.is_alive()]
+    _retire_process_pool(pool)
+    if processes:
+        logger.warning("Terminating %d PDF worker process(es) of a timed-out pool", len(processes))
+    for process in processes:
+        # Jobs of other uploads on this pool fail with BrokenProcessPool and are retried on a new pool
+        process.terminate()
+
+# PDFium is not thread-safe; the functions below only run in single-threaded pool workers
+def _extract_range(pdf_content: bytes, start: int = 0, stop: Optional[int] = None) -> Tuple[str, int]:
+    """Extract text from pages [start, stop) of a PDF using PDFium, returning it with the page count"""
+    pdf = pdfium.PdfDocument(pdf_content)
+    try:
+        page_count = len(pdf)
+        pages = []
+        for index in range(start, page_count if stop is None else min(stop, page_count)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_bounded())
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+
+    return "\n".join(pages), page_count
+
+def _ocr_sync(pdf_content: bytes) -> str:
+    """Render each page of a scanned PDF and run Tesseract OCR on it, one page at a time"""
+    logger.info("PDF has no usable text layer, falling back to OCR")
+    pdf = pdfium.PdfDocument(pdf_content)
+    try:
+        pages = []
+        for page in pdf:
+            # A 300 dpi page bitmap is ~25 MB, so only one is held at a time
+            bitmap = page.render(scale=OCR_RENDER_SCALE)
+            try:
+                pages.append(pytesseract.image_to_string(bitmap.to_pil()))
+            finally:
+                bitmap.close()
+                page.close()
+    finally:
+        pdf.close()
+
+    return "\n".join(pages).strip()
+
 class PDFService:
-    def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=3)
-    
-    async def extract_text_from_pdf(self, pdf_content: bytes) -> Optional[str]:
-        """Extract text from PDF content asynchronously"""
-        loop = asyncio.get_event_loop()
-        
-        def _extract_text():
+    def __init__(self, cache_size: int = 128):
+        self.cache_size = cache_size
+        self._text_cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        # Parsing is CPU-bound, so it runs in worker processes (see _run_in_pool) to escape the GIL
+
+    async def extract_text_from_pdf(self, pdf_content: bytes, content_hash: Optional[str] = None) -> Optional[str]:
+        """Extract text from PDF content asynchronously
+
+        `content_hash` is the SHA-256 hex digest of the content, if the caller already has it.
+        """
+        if not self.validate_pdf(pdf_content):
+            return None
+
+        key = content_hash or hashlib.sha256(pdf_content).hexdigest()
+        if key in self._text_cache:
+            self._text_cache.move_to_end(key)
+            return self._text_cache[key]
+
+        pool = _get_process_pool()
+        try:
+            text = await asyncio.wait_for(self._extract_text(pdf_content), timeout=PDF_EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"PDF text extraction timed out after {PDF_EXTRACT_TIMEOUT}s")
+            # A stuck worker cannot be cancelled; kill it and move later uploads to a fresh pool
+            _terminate_process_pool(pool)
+            text = None
+        except Exception as e:
+            logger.error(f"PDF text extraction error: {str(e)}")
+            text = None
+
+        if text is not None:
+            self._text_cache[key] = text
+            while len(self._text_cache) > self.cache_size:
+                self._text_cache.popitem(last=False)
+
+        return text
+
+    async def _run_in_pool(self, fn, *args):
+        """Run `fn` in the shared process pool, replacing the pool once if a worker died"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = _get_process_pool()
             try:
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-                text = ""
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text()
-                
-                return text.strip()
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # A crashed worker (e.g. PDFium on a malformed file) breaks the whole pool
+                _retire_process_pool(pool)
+                if attempt:
+                    raise
+                logger.warning("PDF worker process died, retrying on a new process pool")
+
+    async def _extract_text(self, pdf_content: bytes) -> str:
+        """Extract text in the process pool, splitting larger PDFs into page ranges"""
+        # The document is only ever opened in worker processes: the first worker
+        # reads the leading pages and reports how many pages are left to split
+        text, page_count = await self._run_in_pool(_extract_range, pdf_content, 0, PARALLEL_MIN_PAGES)
+
+        if page_count > PARALLEL_MIN_PAGES:
+            # Each worker opens its own copy of the document; pages are joined in order
+            chunk = -(-(page_count - PARALLEL_MIN_PAGES) // PDF_MAX_PARALLEL)
+            parts = await asyncio.gather(*[
+                self._run_in_pool(_extract_range, pdf_content, lo, min(lo + chunk, page_count))
+                for lo in range(PARALLEL_MIN_PAGES, page_count, chunk)
+            ])
+            text = "\n".join([text] + [part for part, _ in parts])
+
+        text = text.strip()
+        if len(text) < OCR_MIN_CHARS and pytesseract is not None:
+            try:
+                text = await self._run_in_pool(_ocr_sync, pdf_content) or text
             except Exception as e:
-                logger.error(f"PDF text extraction error: {str(e)}")
-                return None
-        
-        return await loop.run_in_executor(self.executor, _extract_text)
-    
+                # e.g. no tesseract binary installed; keep whatever the text layer had
+                logger.error(f"PDF OCR error: {str(e)}")
+        return text
+
     def validate_pdf(self, pdf_content: bytes) -> bool:
-        """Validate that the content is a valid PDF"""
-        try:
-            PyPDF2.PdfReader(io.BytesIO(pdf_content))
+        """Check that the content starts with a PDF header, without parsing it"""
+        # Readers accept up to 1 KiB of leading junk before the %PDF- marker
+        if PDF_MAGIC in pdf_content[:PDF_HEADER_SCAN]:
             return True
-        except Exception as e:
-            logger.error(f"PDF validation error: {str(e)}")
-            return False
\ No newline at end of file
+        logger.error("PDF validation error: missing %PDF- header")
+        return False
@@ -0,0 +1,75 @@
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_DOCUMENT_TYPES = ('bill', 'discharge_summary', 'id_card')
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    """Parse an ISO date, raising ValueError for anything else that is not empty"""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"Unparseable date: {value!r}")
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"Unparseable date: {value!r}")
+
+
+def rule_based_validate(documents: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Validate document completeness and cross-document consistency without the LLM
+
+    Args:
+        documents: Processed documents with 'type', 'filename', 'data' and 'errors'
+
+    Returns:
+        Validation result, or None when a date cannot be parsed and the LLM has to judge it
+    """
+    data_by_type = {doc.get('type'): doc.get('data') or {} for doc in documents}
+
+    missing_documents = [t for t in REQUIRED_DOCUMENT_TYPES if t not in data_by_type]
+
+    discrepancies = []
+
+    # Every document that names a patient must name the same one
+    patients = {}
+    for doc in documents:
+        name = (doc.get('data') or {}).get('patient_name')
+        if isinstance(name, str) and name.strip():
+            patients.setdefault(" ".join(name.lower().split()), f"{name} ({doc.get('filename')})")
+    if len(patients) > 1:
+        discrepancies.append(f"Patient names do not match: {', '.join(patients.values())}")
+
+    bill = data_by_type.get('bill', {})
+    discharge = data_by_type.get('discharge_summary', {})
+    try:
+        service_date = _parse_date(bill.get('date_of_service'))
+        admission_date = _parse_date(discharge.get('admission_date'))
+        discharge_date = _parse_date(discharge.get('discharge_date'))
+    except ValueError as e:
+        logger.info("Leaving claim validation to the LLM: %s", e)
+        return None
+
+    if admission_date and discharge_date and admission_date > discharge_date:
+        discrepancies.append(f"Admission date ({admission_date}) is after discharge date ({discharge_date})")
+    if service_date and admission_date and discharge_date \
+            and not admission_date <= service_date <= discharge_date:
+        discrepancies.append(
+            f"Bill date of service ({service_date}) is outside the hospital stay ({admission_date} to {discharge_date})"
+        )
+
+    # Missing required fields are already reported by the schema validation of each document
+    data_quality_issues = [
+        f"{doc.get('filename')}: {error}" for doc in documents for error in doc.get('errors') or []
+    ]
+
+    return {
+        "missing_documents": missing_documents,
+        "discrepancies": discrepancies,
+        "data_quality_issues": data_quality_issues,
+        "validation_passed": not (missing_documents or discrepancies or data_quality_issues)
+    }
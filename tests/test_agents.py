@@ -0,0 +1,33 @@
+import logging
+from unittest.mock import MagicMock
+from app.agents.bill_agent import BillAgent
+from app.agents.discharge_agent import DischargeAgent
+
+def test_bill_accepts_null_services():
+    """Extraction returns null for missing list fields; that is not a validation error"""
+    result = BillAgent(MagicMock()).build_result({
+        'hospital_name': 'General Hospital', 'total_amount': 1200.0,
+        'date_of_service': '2024-01-07', 'services': None
+    })
+    assert result['processing_status'] == 'completed'
+    assert result['extracted_data']['services'] == []
+
+def test_discharge_accepts_null_procedures():
+    """Extraction returns null for missing list fields; that is not a validation error"""
+    result = DischargeAgent(MagicMock()).build_result({
+        'patient_name': 'John Doe', 'diagnosis': 'Pneumonia',
+        'admission_date': '2024-01-05', 'discharge_date': '2024-01-10', 'procedures': None
+    })
+    assert result['processing_status'] == 'completed'
+    assert result['validation_errors'] == []
+
+def test_log_arguments_are_formatted_lazily(caplog):
+    """Log arguments are only formatted when the record is emitted"""
+    agent = BillAgent(MagicMock())
+    argument = MagicMock()
+    with caplog.at_level(logging.WARNING):
+        agent.log_info("Found %s", argument)
+    argument.__str__.assert_not_called()
+    with caplog.at_level(logging.INFO):
+        agent.log_info("Found %d validation issues", 2)
+    assert "[BillAgent] Found 2 validation issues" in caplog.text
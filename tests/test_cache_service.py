@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import AsyncMock
+from app.services import cache_service, llm_service
+from app.services.cache_service import ResponseCache, cached
+from app.services.llm_service import LLMService
+
+class FakeService:
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    @cached()
+    async def lookup(self, text):
+        self.calls += 1
+        return self.response
+
+@pytest.fixture(autouse=True)
+def temp_cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(cache_service, 'response_cache', cache)
+    monkeypatch.setattr(llm_service, 'response_cache', cache)
+
+@pytest.mark.asyncio
+async def test_dict_results_are_cached():
+    """Repeated calls with the same inputs are served from the cache"""
+    service = FakeService({'type': 'bill'})
+    assert (await service.lookup('a'))['cache_hit'] is False
+    assert (await service.lookup('a'))['cache_hit'] is True
+    assert service.calls == 1
+
+@pytest.mark.asyncio
+async def test_non_dict_results_are_not_cached():
+    """A non-dict response (e.g. a JSON array) is neither returned nor persisted"""
+    service = FakeService([{'type': 'bill'}])
+    assert await service.lookup('a') == {'cache_hit': False}
+    assert await service.lookup('a') == {'cache_hit': False}
+    assert service.calls == 2
+
+@pytest.mark.asyncio
+async def test_batch_treats_non_dict_entries_as_misses(monkeypatch):
+    """A stale non-dict entry is re-fetched by the batch path instead of being returned"""
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    service = FakeService({'type': 'bill'})
+    await cache_service.response_cache.set(service.lookup.cache_key('a'), [{'type': 'bill'}])
+    batch_call = AsyncMock(return_value=[{'type': 'bill'}])
+    results = await LLMService()._run_cached_batch(service.lookup, [('a',)], batch_call)
+    assert results == [{'type': 'bill', 'cache_hit': False}]
+    batch_call.assert_awaited_once_with([('a',)])
+    assert (await service.lookup('a'))['cache_hit'] is True
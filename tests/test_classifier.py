@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.agents import keywords
+from app.agents.classifier import ClassifierAgent
+from app.models.schemas import DocumentCtx
+
+@pytest.fixture
+def agent():
+    llm_service = MagicMock()
+    llm_service.classify_and_extract = AsyncMock(return_value={
+        'type': 'bill',
+        'confidence': 0.8,
+        'reasoning': 'LLM classification',
+        'extracted': {'hospital_name': 'General Hospital'}
+    })
+    return ClassifierAgent(llm_service)
+
+def test_heuristic_matches_filename_and_anchor(agent):
+    """Filename plus one text anchor is enough for a confident verdict"""
+    result = agent._heuristic_classify("DATE OF DISCHARGE: 2024-04-10", "discharge_summary_2024.pdf")
+    assert result['type'] == 'discharge_summary'
+    assert result['confidence'] == 0.9
+
+def test_heuristic_ambiguous_returns_none(agent):
+    """A single weak signal falls through to the LLM"""
+    assert agent._heuristic_classify("Some unrelated text", "scan_001.pdf") is None
+
+@pytest.mark.asyncio
+async def test_process_skips_llm_on_heuristic_match(agent):
+    """Confident heuristic verdicts do not call the LLM"""
+    result = await agent.process(DocumentCtx(filename='card.pdf', text="MEMBER ID: 123\nPOLICY NUMBER: 456", size=0))
+    assert result['type'] == 'id_card'
+    assert result['extracted_data'] is None
+    agent.llm_service.classify_and_extract.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_falls_back_to_llm(agent):
+    """Ambiguous documents are classified and extracted by one LLM call"""
+    result = await agent.process(DocumentCtx(filename='scan_001.pdf', text="Some unrelated text", size=0))
+    assert result['type'] == 'bill'
+    assert result['extracted_data'] == {'hospital_name': 'General Hospital'}
+    agent.llm_service.classify_and_extract.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_process_batch_keeps_input_order(agent):
+    """Batched results are matched back to their documents"""
+    agent.llm_service.classify_and_extract_batch = AsyncMock(return_value=[
+        {'type': 'bill', 'confidence': 0.8, 'extracted': {'hospital_name': 'General Hospital'}},
+        {'type': 'unknown', 'confidence': 0.2, 'extracted': {}},
+    ])
+    documents = [
+        DocumentCtx(filename='scan_001.pdf', text="Some unrelated text", size=0),
+        DocumentCtx(filename='scan_002.pdf', text="More unrelated text", size=0),
+    ]
+    results = await agent.process_batch(documents)
+    assert [r['filename'] for r in results] == ['scan_001.pdf', 'scan_002.pdf']
+    assert results[0]['extracted_data'] == {'hospital_name': 'General Hospital'}
+    assert results[1]['type'] == 'unknown'
+
+def test_keyword_scan_counts_overlapping_anchors():
+    """Overlapping anchors such as 'total amount' and 'amount due' both count"""
+    assert keywords.scan("TOTAL AMOUNT DUE: $1,200") == {'bill': 2}
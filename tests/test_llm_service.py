@@ -0,0 +1,214 @@
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from google.api_core.exceptions import ResourceExhausted
+from tenacity import wait_none
+from app.services import cache_service, llm_service as llm_service_module
+from app.services.cache_service import ResponseCache
+from app.services.llm_service import DISCHARGE_FOCUS, LLMService, _compact_text
+
+@pytest.fixture
+def llm_service(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    return LLMService()
+
+@pytest.fixture
+def no_retry_wait(monkeypatch):
+    """Retry immediately instead of backing off"""
+    # Walk down the stacked @retry decorators (rate limit, then transient errors)
+    func = LLMService._generate_limited
+    while hasattr(func, 'retry'):
+        monkeypatch.setattr(func.retry, 'wait', wait_none())
+        func = func.__wrapped__
+
+class FakeModel:
+    """Stands in for the Gemini model; `responses` are returned or raised in order"""
+    def __init__(self, *responses, delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None, stream=False, request_options=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(response, Exception):
+            raise response
+        if stream:
+            return [SimpleNamespace(text=chunk) for chunk in response]
+        return SimpleNamespace(text=response)
+
+@pytest.fixture
+def temp_cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(cache_service, 'response_cache', cache)
+    monkeypatch.setattr(llm_service_module, 'response_cache', cache)
+
+@pytest.mark.asyncio
+async def test_valid_responses_are_cached(llm_service):
+    """Identical prompts are answered from the prompt cache"""
+    llm_service._generate_limited = AsyncMock(return_value='{"type": "bill"}')
+    assert await llm_service.generate_async("prompt") == '{"type": "bill"}'
+    assert await llm_service.generate_async("prompt") == '{"type": "bill"}'
+    assert llm_service._generate_limited.await_count == 1
+
+@pytest.mark.asyncio
+async def test_unparseable_responses_are_not_cached(llm_service):
+    """A truncated response is not pinned, so retrying the same prompt calls Gemini again"""
+    llm_service._generate_limited = AsyncMock(return_value='{"type": "bi')
+    await llm_service.generate_async("prompt")
+    await llm_service.generate_async("prompt")
+    assert llm_service._generate_limited.await_count == 2
+
+@pytest.mark.asyncio
+async def test_responses_of_wrong_type_are_not_cached(llm_service):
+    """A JSON array where an object is expected is not cached"""
+    llm_service._generate_limited = AsyncMock(return_value='[{"type": "bill"}]')
+    await llm_service.generate_async("prompt")
+    await llm_service.generate_async("prompt")
+    assert llm_service._generate_limited.await_count == 2
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_prompts_share_one_call(llm_service):
+    """Prompts already in flight are joined instead of sent again"""
+    release = asyncio.Event()
+
+    async def generate(*args):
+        await release.wait()
+        return '{"type": "bill"}'
+
+    llm_service._generate_limited = AsyncMock(side_effect=generate)
+    calls = [asyncio.create_task(llm_service.generate_async("prompt")) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*calls) == ['{"type": "bill"}'] * 5
+    assert llm_service._generate_limited.await_count == 1
+
+@pytest.mark.asyncio
+async def test_waiters_restart_when_leader_is_cancelled(llm_service):
+    """Cancelling the caller that owns a call does not cancel the callers joined to it"""
+    async def generate(*args):
+        if llm_service._generate_limited.await_count == 1:
+            await asyncio.Event().wait()
+        return '{"type": "bill"}'
+
+    llm_service._generate_limited = AsyncMock(side_effect=generate)
+    leader = asyncio.create_task(llm_service.generate_async("prompt"))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(llm_service.generate_async("prompt")) for _ in range(2)]
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await asyncio.gather(*waiters) == ['{"type": "bill"}'] * 2
+    assert leader.cancelled()
+    assert llm_service._generate_limited.await_count == 2
+
+@pytest.mark.asyncio
+async def test_leader_exception_reaches_every_waiter(llm_service):
+    """A failed shared call raises in every caller joined to it"""
+    release = asyncio.Event()
+
+    async def generate(*args):
+        await release.wait()
+        raise ValueError("bad request")
+
+    llm_service._generate_limited = AsyncMock(side_effect=generate)
+    calls = [asyncio.create_task(llm_service.generate_async("prompt")) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert llm_service._generate_limited.await_count == 1
+
+@pytest.mark.asyncio
+async def test_stream_passes_chunks_in_order(llm_service):
+    """Streamed chunks reach on_chunk as they arrive and are joined into the response"""
+    llm_service.model = FakeModel(['{"type": ', '"bill"', '}'])
+    chunks = []
+    response = await llm_service.generate_stream_async("prompt", on_chunk=chunks.append)
+    assert chunks == ['{"type": ', '"bill"', '}']
+    assert response == '{"type": "bill"}'
+
+@pytest.mark.asyncio
+async def test_stalled_stream_times_out_and_is_retried(llm_service, no_retry_wait):
+    """A stream that outlives the request timeout is cut off and retried twice"""
+    llm_service.request_timeout = 0.05
+    llm_service.model = FakeModel(['{}'], delay=0.2)
+    with pytest.raises(asyncio.TimeoutError):
+        await llm_service.generate_stream_async("prompt")
+    assert llm_service.model.calls == 3
+    # Let the abandoned stream threads finish before the event loop closes
+    await asyncio.sleep(llm_service.model.delay)
+
+@pytest.mark.asyncio
+async def test_rate_limit_errors_are_retried(llm_service, no_retry_wait):
+    """429s from Gemini are retried until a call succeeds"""
+    llm_service.model = FakeModel(ResourceExhausted("quota"), ResourceExhausted("quota"), '{"type": "bill"}')
+    assert await llm_service.generate_async("prompt") == '{"type": "bill"}'
+    assert llm_service.model.calls == 3
+
+@pytest.mark.asyncio
+async def test_validate_claim_data_uses_shared_rules(llm_service, temp_cache):
+    """Consistent claims are validated by the same rules as the orchestrator, without Gemini"""
+    llm_service._generate_limited = AsyncMock()
+    documents = [
+        {'type': 'bill', 'filename': 'bill.pdf', 'data': {'date_of_service': '2024-01-07'}, 'errors': ['total_amount: field required']},
+        {'type': 'discharge_summary', 'filename': 'discharge.pdf', 'data': {'admission_date': '2024-01-05', 'discharge_date': '2024-01-10'}, 'errors': []},
+        {'type': 'id_card', 'filename': 'card.pdf', 'data': {}, 'errors': []},
+    ]
+    result = await llm_service.validate_claim_data(documents)
+    assert result['data_quality_issues'] == ['bill.pdf: total_amount: field required']
+    assert not result['validation_passed']
+    llm_service._generate_limited.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_malformed_batch_items_are_not_cached(llm_service, temp_cache):
+    """Batch items missing the classification fields go to the per-document fallback"""
+    single = '{"type": "bill", "confidence": 0.9, "reasoning": "invoice", "extracted": {}}'
+    llm_service._generate_limited = AsyncMock(side_effect=[
+        '[{"index": 1}, {"index": 2, "type": "invoice", "confidence": "high", "extracted": "n/a"}]',
+        single,
+        single.replace('0.9', '0.8'),
+    ])
+    results = await llm_service.classify_and_extract_batch([("text one", "a.pdf"), ("text two", "b.pdf")])
+    assert [result['type'] for result in results] == ['bill', 'bill']
+    assert llm_service._generate_limited.await_count == 3
+
+    cached = await llm_service.classify_and_extract("text one", "a.pdf")
+    assert cached['cache_hit'] is True
+    assert cached['type'] == 'bill'
+    assert llm_service._generate_limited.await_count == 3
+
+def test_compact_text_drops_only_standalone_footers():
+    """Footer lines are removed, but lines that also carry content are kept"""
+    text = (
+        "CONFIDENTIAL\n"
+        "Page 2 of 3\n"
+        "© 2024 General Hospital. All rights reserved.\n"
+        "CONFIDENTIAL - Discharge Summary for Patient: John Doe\n"
+        "Copyright General Hospital   Diagnosis: Pneumonia\n"
+        "Admission Date: 2024-01-05"
+    )
+    assert _compact_text(text) == (
+        "CONFIDENTIAL - Discharge Summary for Patient: John Doe\n"
+        "Copyright General Hospital Diagnosis: Pneumonia\n"
+        "Admission Date: 2024-01-05"
+    )
+
+def test_compact_text_focus_window_keeps_matches_on_long_lines():
+    """The focus window is not snapped back to the start of a very long line"""
+    text = "filler " * 2000 + "Diagnosis: Pneumonia. Admission 2024-01-05, discharge 2024-01-10. " + "filler " * 2000
+    window = _compact_text(text, 400, DISCHARGE_FOCUS)
+    assert len(window) <= 400
+    assert "Diagnosis: Pneumonia" in window
+
+@pytest.mark.asyncio
+async def test_classify_document_reuses_classify_and_extract(llm_service, temp_cache):
+    """classify_document is the fused call without the extracted fields"""
+    llm_service._generate_limited = AsyncMock(
+        return_value='{"type": "id_card", "confidence": 0.9, "reasoning": "member card", "extracted": {"policy_number": "P-1"}}'
+    )
+    result = await llm_service.classify_document("Member ID M-1", "card.pdf")
+    assert result == {'type': 'id_card', 'confidence': 0.9, 'reasoning': 'member card', 'cache_hit': False}
+    assert (await llm_service.classify_and_extract("Member ID M-1", "card.pdf"))['cache_hit'] is True
@@ -19,4 +19,18 @@ def test_health_check():
 def test_process_claim_no_files():
     """Test process claim endpoint with no files"""
     response = client.post("/process-claim")
-    assert response.status_code == 422  # Validation error
\ No newline at end of file
+    assert response.status_code == 422  # Validation error
+
+
+def test_process_claim_stream_no_files():
+    """Test streaming process claim endpoint with no files"""
+    response = client.post("/process-claim/stream")
+    assert response.status_code == 422  # Validation error
+
+def test_process_claim_stream_rejects_non_pdf():
+    """Test streaming process claim endpoint rejects non-PDF uploads before streaming"""
+    response = client.post(
+        "/process-claim/stream",
+        files=[("files", ("notes.txt", b"not a pdf", "text/plain"))]
+    )
+    assert response.status_code == 400
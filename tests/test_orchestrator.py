@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.agents.orchestrator import ClaimOrchestrator
+from app.models.schemas import ClaimStatus, DocumentCtx
+
+@pytest.fixture
+def orchestrator():
+    llm_service = MagicMock()
+    llm_service.validate_and_decide = AsyncMock(return_value={
+        'validation': {
+            'missing_documents': [],
+            'discrepancies': ['Needs human review'],
+            'data_quality_issues': [],
+            'validation_passed': False
+        },
+        'decision': {
+            'status': 'requires_review',
+            'reason': 'LLM decision',
+            'confidence': 0.7,
+            'recommended_actions': []
+        }
+    })
+    return ClaimOrchestrator(llm_service)
+
+def make_docs(bill=None, discharge=None, id_card=None):
+    """Build a clean, consistent set of claim documents with optional field overrides"""
+    return [
+        DocumentCtx(filename='bill.pdf', text='', size=0, type='bill', processing_status='completed', extracted_data={
+            'hospital_name': 'General Hospital', 'total_amount': 1200.0,
+            'date_of_service': '2024-01-07', 'patient_name': 'John Doe', **(bill or {})
+        }),
+        DocumentCtx(filename='discharge.pdf', text='', size=0, type='discharge_summary', processing_status='completed', extracted_data={
+            'patient_name': 'John Doe', 'diagnosis': 'Pneumonia',
+            'admission_date': '2024-01-05', 'discharge_date': '2024-01-10', **(discharge or {})
+        }),
+        DocumentCtx(filename='card.pdf', text='', size=0, type='id_card', processing_status='completed', extracted_data={
+            'patient_name': 'JOHN DOE', 'insurance_id': 'M-1', 'policy_number': 'P-1', **(id_card or {})
+        }),
+    ]
+
+@pytest.mark.asyncio
+async def test_consistent_claim_is_approved_without_llm(orchestrator):
+    """Complete, consistent claims are approved by the rules alone"""
+    validation, decision = await orchestrator._decide_claim(make_docs())
+    assert validation.validation_passed
+    assert decision.status == ClaimStatus.APPROVED
+    orchestrator.llm_service.validate_and_decide.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_failed_document_requires_review(orchestrator):
+    """A document that failed processing sends the claim to review without the LLM"""
+    docs = make_docs()
+    docs[0].processing_status = 'failed'
+    validation, decision = await orchestrator._decide_claim(docs)
+    assert decision.status == ClaimStatus.REQUIRES_REVIEW
+    orchestrator.llm_service.validate_and_decide.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_non_iso_dates_escalate_to_llm(orchestrator):
+    """Dates the rules cannot parse are never compared as strings"""
+    docs = make_docs(
+        bill={'date_of_service': '01/07/2023'},
+        discharge={'admission_date': '01/05/2024', 'discharge_date': '01/10/2024'}
+    )
+    validation, decision = await orchestrator._decide_claim(docs)
+    assert decision.status == ClaimStatus.REQUIRES_REVIEW
+    orchestrator.llm_service.validate_and_decide.assert_awaited_once()
+
+def test_service_date_outside_stay_is_not_approved(orchestrator):
+    """A bill dated outside the hospital stay is flagged"""
+    docs = make_docs(bill={'date_of_service': '2023-01-07'})
+    validation = orchestrator._rule_based_validate(docs)
+    assert not validation.validation_passed
+    assert 'outside the hospital stay' in validation.discrepancies[0]
+
+@pytest.mark.asyncio
+async def test_patient_mismatch_on_any_document_is_not_approved(orchestrator):
+    """Names are compared across every document, not just bill and ID card"""
+    docs = make_docs(bill={'patient_name': None}, discharge={'patient_name': 'Jane Roe'})
+    validation, decision = await orchestrator._decide_claim(docs)
+    assert not orchestrator._rule_based_validate(docs).validation_passed
+    assert decision.status != ClaimStatus.APPROVED
+    orchestrator.llm_service.validate_and_decide.assert_awaited_once()
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import time
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from app.services import pdf_service
+from app.services.pdf_service import PDFService
+
+def make_pdf(pages):
+    """Build a minimal PDF with one line of Helvetica text per page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+def _crash():
+    os._exit(1)
+
+def _ok():
+    return "ok"
+
+def _hang(pid_path):
+    with open(pid_path, "w") as f:
+        f.write(str(os.getpid()))
+    time.sleep(60)
+
+@pytest.mark.asyncio
+async def test_extracts_pages_in_order():
+    """Large PDFs are split across workers and joined in page order"""
+    pages = [f"Page text {i}" for i in range(6)]
+    text = await PDFService().extract_text_from_pdf(make_pdf(pages))
+    assert [line.strip() for line in text.splitlines()] == pages
+
+@pytest.mark.asyncio
+async def test_rejects_non_pdf_content():
+    """Content without a PDF header is never parsed"""
+    assert await PDFService().extract_text_from_pdf(b"not a pdf") is None
+
+@pytest.mark.asyncio
+async def test_recovers_from_crashed_worker():
+    """A worker crash does not break extraction for later uploads"""
+    service = PDFService()
+    with pytest.raises(BrokenProcessPool):
+        await service._run_in_pool(_crash)
+    assert await service._run_in_pool(_ok) == "ok"
+
+@pytest.mark.asyncio
+async def test_timeout_kills_hung_worker(tmp_path, monkeypatch):
+    """A worker stuck past PDF_EXTRACT_TIMEOUT is terminated instead of leaking"""
+    service = PDFService()
+    pid_path = tmp_path / "worker.pid"
+    monkeypatch.setattr(pdf_service, 'PDF_EXTRACT_TIMEOUT', 1)
+    monkeypatch.setattr(service, '_extract_text', lambda content: service._run_in_pool(_hang, str(pid_path)))
+    assert await service.extract_text_from_pdf(make_pdf(["Hung"])) is None
+
+    pid = int(pid_path.read_text())
+    deadline = time.monotonic() + 5
+    while pid in [child.pid for child in multiprocessing.active_children()] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert pid not in [child.pid for child in multiprocessing.active_children()]
+    assert await service._run_in_pool(_ok) == "ok"
+
+@pytest.mark.asyncio
+async def test_short_pdf_is_parsed_by_one_worker(monkeypatch):
+    """PDFs up to PARALLEL_MIN_PAGES are parsed once, entirely in a worker"""
+    service = PDFService()
+    calls = []
+    run_in_pool = service._run_in_pool
+
+    async def counting_run_in_pool(fn, *args):
+        calls.append(fn.__name__)
+        return await run_in_pool(fn, *args)
+
+    monkeypatch.setattr(service, '_run_in_pool', counting_run_in_pool)
+    text = await service.extract_text_from_pdf(make_pdf(["Only page"]))
+    assert text == "Only page"
+    assert calls == ['_extract_range']
+
+@pytest.mark.asyncio
+async def test_ocr_failure_keeps_text_layer(monkeypatch):
+    """An OCR error falls back to the extracted text instead of failing the document"""
+    service = PDFService()
+    run_in_pool = service._run_in_pool
+
+    async def failing_ocr(fn, *args):
+        if fn is pdf_service._ocr_sync:
+            raise RuntimeError("tesseract is not installed")
+        return await run_in_pool(fn, *args)
+
+    monkeypatch.setattr(pdf_service, 'pytesseract', object())
+    monkeypatch.setattr(service, '_run_in_pool', failing_ocr)
+    assert await service.extract_text_from_pdf(make_pdf(["Short"])) == "Short"